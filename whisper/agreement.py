@@ -0,0 +1,23 @@
+class LocalAgreement:
+    """ 局部一致性：连续两次识别结果的公共前缀认为已经稳定，之后不再改变
+    稳定的部分作为下一次解码的前缀，每次只需重新识别不稳定的尾部 """
+    def __init__(self):
+        self.committed = []     # 已稳定的词
+        self.previous = []      # 上一次的识别结果
+
+    @property
+    def prefix(self):
+        return " ".join(self.committed)
+
+    def update(self, tail):
+        # tail是在已稳定前缀之后识别出的文本，返回(稳定文本, 不稳定文本)
+        words = self.committed + tail.split()
+        common = 0
+        for a, b in zip(self.previous, words):
+            if a != b:
+                break
+            common += 1
+        if common > len(self.committed):
+            self.committed = words[:common]
+        self.previous = words
+        return " ".join(self.committed), " ".join(words[len(self.committed):])
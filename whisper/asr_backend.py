@@ -0,0 +1,225 @@
+import os
+import logging
+import threading
+import numpy as np
+import config
+import packing
+
+log = logging.getLogger(__name__)
+
+class ASRBackend:
+    """ 语音识别引擎接口
+    decode_windows输入若干30秒窗口，返回每个窗口的片段列表[(起始秒, 结束秒, 文本)] """
+    name = ""
+    concurrency = 1     # 可以同时执行的decode_windows调用数
+
+    def decode_windows(self, windows, prefix=None, language=None, prompt=None):
+        # prefix为已确定的文本，解码从它之后开始，结果不包含prefix
+        # language为None时自动检测语言，prompt为之前几句话的文本
+        raise NotImplementedError
+
+    def detect_language(self, audio):
+        # 返回(语言, 概率)，不支持时返回(None, 0.0)
+        return None, 0.0
+
+    def transcribe_batch(self, audios, language=None, prompt=None, groups=None):
+        # 输入若干句音频，返回对应的文本；groups不为None时只有同一组的音频打包进同一个窗口
+        def decode(windows):
+            return self.decode_windows(windows, language=language, prompt=prompt)
+        if config.PackSentences:
+            return packing.transcribe_packed(audios, decode, groups)
+        segments = decode([packing.pad_or_trim(audio) for audio in audios])
+        return ["".join(text for _, _, text in window).strip() for window in segments]
+
+    def warmup(self):
+        # 用一秒静音解码一次，让第一句话不再承担初始化的开销
+        self.transcribe_batch([np.zeros(config.RATE, np.float32)])
+
+    def transcribe_partial(self, audio, prefix=None, language=None, prompt=None):
+        # 识别一句还没说完的话，不参与批处理和打包
+        segments = self.decode_windows([packing.pad_or_trim(audio)], prefix=prefix or None,
+                                       language=language, prompt=prompt)
+        return "".join(text for _, _, text in segments[0]).strip()
+
+class TorchBackend(ASRBackend):
+    """ openai-whisper + PyTorch，quantize=True时对线性层做int8动态量化（仅CPU）
+    checkpoint为fp32权重文件时通过mmap加载，多个进程共享同一份物理内存
+    threads为计算线程数，None表示自动
+    whisper解码时在共享的解码器模块上挂kv-cache钩子，同一个模型不能同时解码，
+    batcher、中间识别等所有调用都经过decode_lock串行执行 """
+    def __init__(self, model_name=config.VoiceToWordModel, quantize=False, checkpoint=None, threads=None):
+        import torch
+        import whisper
+        if threads:
+            torch.set_num_threads(threads)
+        self.name = "torch-int8" if quantize else "torch"
+        self.device = "cuda" if torch.cuda.is_available() and not quantize and not checkpoint else "cpu"
+        # CPU上优先从本地缓存的fp32权重文件加载
+        if not checkpoint and self.device == "cpu" and config.CacheModels:
+            checkpoint = cached_checkpoint(model_name)
+        if checkpoint:
+            self.model = load_mmap_model(checkpoint)
+        else:
+            self.model = whisper.load_model(model_name, device=self.device)
+        if quantize:
+            self.model = torch.quantization.quantize_dynamic(
+                _plain_linear(self.model), {torch.nn.Linear}, dtype=torch.qint8)
+        self.options = whisper.DecodingOptions(
+            task="transcribe",
+            language=None,
+            fp16=self.device == "cuda"
+        )
+        self.language_options = {}      # 语言 -> 解码参数
+        self.decode_lock = threading.Lock()
+        log.info("识别引擎: %s, 设备: %s", self.name, self.device)
+
+    def get_options(self, language, prefix, prompt):
+        # 每种语言的解码参数只创建一次，prefix和prompt每句不同，按需替换
+        import dataclasses
+        options = self.language_options.get(language)
+        if options is None:
+            options = self.language_options[language] = dataclasses.replace(self.options, language=language)
+        if prefix or prompt:
+            options = dataclasses.replace(options, prefix=prefix, prompt=prompt)
+        return options
+
+    def get_tokenizer(self, language):
+        # whisper的get_tokenizer带有缓存
+        from whisper.tokenizer import get_tokenizer
+        return get_tokenizer(self.model.is_multilingual, num_languages=self.model.num_languages,
+                             language=language, task=self.options.task)
+
+    def detect_language(self, audio):
+        import whisper
+        mel = whisper.log_mel_spectrogram(packing.pad_or_trim(audio)).to(self.device)
+        # 语言检测也会运行解码器，与解码共用同一把锁
+        with self.decode_lock:
+            _, probs = self.model.detect_language(mel)
+        language = max(probs, key=probs.get)
+        return language, probs[language]
+
+    def decode_windows(self, windows, prefix=None, language=None, prompt=None):
+        import torch
+        import whisper
+        mel = torch.stack([whisper.log_mel_spectrogram(w) for w in windows]).to(self.device)
+        with self.decode_lock:
+            results = whisper.decode(self.model, mel, self.get_options(language, prefix, prompt))
+        return [packing.parse_segments(result.tokens, self.get_tokenizer(result.language))
+                for result in results]
+
+def cached_checkpoint(model_name):
+    """ 把whisper的fp16权重转换为fp32保存到本地缓存，之后通过mmap直接加载，多个进程共享同一份内存 """
+    path = os.path.join(config.ModelCacheDir, f"whisper-{model_name}-fp32.pt")
+    if os.path.exists(path):
+        return path
+    import torch
+    import whisper
+    os.makedirs(config.ModelCacheDir, exist_ok=True)
+    model = whisper.load_model(model_name, device="cpu")
+    tmp = path + ".tmp"
+    torch.save({"dims": vars(model.dims), "model_state_dict": model.state_dict()}, tmp)
+    os.replace(tmp, path)
+    log.info("已生成模型缓存: %s", path)
+    return path
+
+def load_mmap_model(checkpoint):
+    # 权重直接引用mmap映射的文件，不拷贝到进程内存
+    import torch
+    from whisper.model import ModelDimensions, Whisper
+    ckpt = torch.load(checkpoint, map_location="cpu", mmap=True, weights_only=False)
+    model = Whisper(ModelDimensions(**ckpt["dims"]))
+    model.load_state_dict(ckpt["model_state_dict"], assign=True)
+    return model.eval()
+
+def _plain_linear(model):
+    # whisper的Linear是nn.Linear的子类，动态量化只识别nn.Linear，先替换为nn.Linear
+    import torch
+    import whisper.model
+    for module in list(model.modules()):
+        for name, child in module.named_children():
+            if isinstance(child, whisper.model.Linear):
+                linear = torch.nn.Linear(child.in_features, child.out_features, bias=child.bias is not None)
+                linear.load_state_dict(child.state_dict())
+                setattr(module, name, linear)
+    return model
+
+class CT2Backend(ASRBackend):
+    """ faster-whisper（CTranslate2），CPU上使用int8计算 """
+    def __init__(self, model_name=config.VoiceToWordModel, compute_type="int8", threads=None):
+        from faster_whisper import WhisperModel
+        self.name = f"ct2-{compute_type}"
+        self.model = WhisperModel(model_name, device="cpu", compute_type=compute_type,
+                                  cpu_threads=threads or 0,
+                                  download_root=os.path.join(config.ModelCacheDir, "ct2"))
+        log.info("识别引擎: %s, 设备: cpu", self.name)
+
+    def detect_language(self, audio):
+        language, probability, _ = self.model.detect_language(packing.pad_or_trim(audio))
+        return language, probability
+
+    def decode_windows(self, windows, prefix=None, language=None, prompt=None):
+        segments = []
+        for window in windows:
+            result, _ = self.model.transcribe(
+                window, beam_size=1, vad_filter=False, prefix=prefix,
+                language=language, initial_prompt=prompt,
+                condition_on_previous_text=False, without_timestamps=False)
+            segments.append([(s.start, s.end, s.text) for s in result])
+        return segments
+
+class OnnxBackend(ASRBackend):
+    """ 通过optimum导出的ONNX模型，使用ONNX Runtime推理 """
+    def __init__(self, model_name=config.VoiceToWordModel, threads=None):
+        import onnxruntime
+        from optimum.onnxruntime import ORTModelForSpeechSeq2Seq
+        from transformers import WhisperProcessor
+        self.name = "onnx"
+        session_options = onnxruntime.SessionOptions()
+        if threads:
+            session_options.intra_op_num_threads = threads
+            session_options.inter_op_num_threads = 1
+        repo = f"openai/whisper-{model_name}"
+        # 导出的ONNX模型保存在本地缓存中，之后直接加载
+        local = os.path.join(config.ModelCacheDir, f"onnx-whisper-{model_name}")
+        if os.path.isdir(local):
+            self.processor = WhisperProcessor.from_pretrained(local)
+            self.model = ORTModelForSpeechSeq2Seq.from_pretrained(local, session_options=session_options)
+        else:
+            self.processor = WhisperProcessor.from_pretrained(repo)
+            self.model = ORTModelForSpeechSeq2Seq.from_pretrained(repo, export=True, session_options=session_options)
+            if config.CacheModels:
+                self.processor.save_pretrained(local)
+                self.model.save_pretrained(local)
+        log.info("识别引擎: %s, 设备: cpu", self.name)
+
+    def decode_windows(self, windows, prefix=None, language=None, prompt=None):
+        # transformers的generate不支持强制前缀，忽略prefix
+        features = self.processor(windows, sampling_rate=config.RATE, return_tensors="pt").input_features
+        kwargs = {"language": language} if language else {}
+        if prompt:
+            kwargs["prompt_ids"] = self.processor.get_prompt_ids(prompt, return_tensors="pt")
+        ids = self.model.generate(features, return_timestamps=True, task="transcribe", **kwargs)
+        segments = []
+        for seq in ids:
+            decoded = self.processor.tokenizer.decode(seq, skip_special_tokens=True, output_offsets=True)
+            segments.append([(o["timestamp"][0], o["timestamp"][1], o["text"]) for o in decoded["offsets"]])
+        return segments
+
+ENGINES = {
+    "torch": lambda model_name, threads: TorchBackend(model_name, threads=threads),
+    "torch-int8": lambda model_name, threads: TorchBackend(model_name, quantize=True, threads=threads),
+    "ct2-int8": lambda model_name, threads: CT2Backend(model_name, "int8", threads),
+    "onnx": lambda model_name, threads: OnnxBackend(model_name, threads),
+}
+
+def create_backend(engine=None, model_name=None, processes=None, threads=None):
+    # processes大于0时在多个子进程中运行识别引擎，threads为每个进程的计算线程数
+    engine = engine or config.AsrEngine
+    model_name = model_name or config.VoiceToWordModel
+    processes = config.AsrProcesses if processes is None else processes
+    if engine not in ENGINES:
+        raise ValueError(f"未知的识别引擎: {engine}，可选: {', '.join(ENGINES)}")
+    if processes > 0:
+        from asr_pool import ProcessPoolBackend
+        return ProcessPoolBackend(engine, model_name, processes, threads)
+    return ENGINES[engine](model_name, threads or config.AsrThreads or None)
@@ -0,0 +1,201 @@
+import os
+import time
+import queue
+import logging
+import threading
+import multiprocessing as mp
+from concurrent.futures import Future
+import config
+from asr_backend import ASRBackend, cached_checkpoint
+
+log = logging.getLogger(__name__)
+
+def _worker_main(worker_id, generation, engine, model_name, threads, checkpoint, requests, results):
+    # 子进程：加载识别引擎后循环处理解码任务，线程数在各引擎的构造函数中设置
+    # 加载成功时发送(进程编号, 代数, None, None)，失败时把异常放在最后一项后退出
+    try:
+        import asr_backend
+        if checkpoint:
+            import torch
+            torch.set_num_interop_threads(1)
+            backend = asr_backend.TorchBackend(model_name, checkpoint=checkpoint, threads=threads)
+        else:
+            backend = asr_backend.create_backend(engine, model_name, processes=0, threads=threads)
+    except Exception as e:
+        results.put((worker_id, generation, None, RuntimeError(f"识别引擎加载失败: {e!r}")))
+        return
+    results.put((worker_id, generation, None, None))
+    while True:
+        job = requests.get()
+        if job is None:
+            return
+        job_id, method, kwargs = job
+        try:
+            results.put((worker_id, generation, job_id, getattr(backend, method)(**kwargs)))
+        except Exception as e:
+            results.put((worker_id, generation, job_id, e))
+
+class ProcessPoolBackend(ASRBackend):
+    """ 在多个子进程中运行识别引擎，每个任务交给空闲的进程
+    torch引擎各进程通过mmap共享同一份fp32权重，其他引擎各进程单独加载模型
+    进程意外退出时，它正在处理的任务失败，并启动新的进程代替它
+    启动时有进程加载失败则抛出异常；运行中重启的进程连续AsrPoolMaxRestarts次没有加载成功时不再重启
+    空闲队列中保存(进程编号, 代数)，进程重启后旧的编号作废 """
+    def __init__(self, engine, model_name, processes, threads=None):
+        self.name = f"{engine}x{processes}"
+        self.concurrency = processes
+        self.engine = engine
+        self.model_name = model_name
+        self.threads = threads or config.AsrThreadsPerProcess or max(1, (os.cpu_count() or 1) // processes)
+        self.checkpoint = cached_checkpoint(model_name) if engine == "torch" else None
+
+        self.ctx = mp.get_context("spawn")
+        self.results = self.ctx.Queue()
+        self.requests = [None] * processes
+        self.processes = [None] * processes
+        self.generations = [0] * processes
+        self.ready = [False] * processes        # 进程是否已经加载完模型
+        self.failures = [0] * processes         # 连续启动失败的次数
+        self.abandoned = set()                  # 不再重启的进程编号
+        self.starting = True
+        self.startup_error = None
+        self.idle = queue.Queue()       # 空闲的(进程编号, 代数)
+        self.pending = {}               # 任务编号 -> (进程编号, 代数, Future)
+        self.lock = threading.Lock()
+        self.next_job = 0
+        self.started = threading.Semaphore(0)
+        for worker_id in range(processes):
+            self._spawn(worker_id)
+        threading.Thread(target=self._collect_results, name="asr-pool-results", daemon=True).start()
+
+        # 等待所有进程加载完模型，有进程加载失败时停止所有进程并抛出异常
+        for _ in range(processes):
+            self.started.acquire()
+            if self.startup_error is not None:
+                self.terminate()
+                raise RuntimeError(f"识别进程池启动失败: {self.startup_error}")
+        self.starting = False
+        log.info("识别进程池已启动: %s，每个进程%d个线程", self.name, self.threads)
+
+    def _spawn(self, worker_id):
+        # 启动（或重启）一个进程，加载完模型后由结果线程放入空闲队列
+        with self.lock:
+            self.generations[worker_id] += 1
+            generation = self.generations[worker_id]
+        self.ready[worker_id] = False
+        requests = self.ctx.Queue()
+        process = self.ctx.Process(
+            target=_worker_main, name=f"asr-worker-{worker_id}", daemon=True,
+            args=(worker_id, generation, self.engine, self.model_name, self.threads,
+                  self.checkpoint, requests, self.results))
+        process.start()
+        self.requests[worker_id] = requests
+        self.processes[worker_id] = process
+
+    def _current(self, worker_id, generation):
+        return self.generations[worker_id] == generation and self.processes[worker_id].is_alive()
+
+    def warmup(self):
+        # 每个进程都预热一次
+        threads = [threading.Thread(target=ASRBackend.warmup, args=(self,)) for _ in self.processes]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    def decode_windows(self, windows, prefix=None, language=None, prompt=None):
+        return self._call("decode_windows", windows=windows, prefix=prefix, language=language, prompt=prompt)
+
+    def detect_language(self, audio):
+        return self._call("detect_language", audio=audio)
+
+    def _call(self, method, **kwargs):
+        # 交给空闲的进程执行，等待超过AsrPoolTimeout秒仍没有可用的进程时失败
+        deadline = time.monotonic() + config.AsrPoolTimeout
+        while True:
+            try:
+                worker_id, generation = self.idle.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                raise RuntimeError("没有可用的识别进程") from None
+            if self._current(worker_id, generation):
+                break
+        future = Future()
+        with self.lock:
+            job_id = self.next_job
+            self.next_job += 1
+            self.pending[job_id] = (worker_id, generation, future)
+        self.requests[worker_id].put((job_id, method, kwargs))
+        try:
+            return future.result()
+        finally:
+            if self._current(worker_id, generation):
+                self.idle.put((worker_id, generation))
+
+    def _collect_results(self):
+        while True:
+            try:
+                worker_id, generation, job_id, result = self.results.get(timeout=0.2)
+            except queue.Empty:
+                result = job_id = None
+            else:
+                if job_id is None and result is None:
+                    # 进程加载完模型
+                    self.ready[worker_id] = True
+                    self.failures[worker_id] = 0
+                    self.idle.put((worker_id, generation))
+                    self.started.release()
+                elif job_id is None:
+                    # 进程加载失败后会退出，由_check_workers处理
+                    log.error("识别进程%d: %s", worker_id, result)
+                    self.startup_error = result
+            # 每一轮都检查进程是否存活，不依赖结果队列空闲
+            self._check_workers()
+            if job_id is None:
+                continue
+            with self.lock:
+                _, _, future = self.pending.pop(job_id, (None, None, None))
+            if future is None:
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def _check_workers(self):
+        # 进程意外退出时，让它正在处理的任务失败，并启动新的进程
+        dead = [worker_id for worker_id, process in enumerate(self.processes)
+                if worker_id not in self.abandoned and not process.is_alive()]
+        if not dead:
+            return
+        with self.lock:
+            jobs = [job_id for job_id, (worker_id, _, _) in self.pending.items() if worker_id in dead]
+            futures = [self.pending.pop(job_id)[2] for job_id in jobs]
+        for future in futures:
+            future.set_exception(RuntimeError("识别进程意外退出"))
+        for worker_id in dead:
+            exitcode = self.processes[worker_id].exitcode
+            if not self.ready[worker_id]:
+                self.failures[worker_id] += 1
+                if self.starting:
+                    # 启动阶段加载失败，唤醒__init__抛出异常
+                    self.abandoned.add(worker_id)
+                    if self.startup_error is None:
+                        self.startup_error = f"进程{worker_id}在加载模型时退出（退出码{exitcode}）"
+                    self.started.release()
+                    continue
+                if self.failures[worker_id] >= config.AsrPoolMaxRestarts:
+                    log.error("识别进程%d连续%d次启动失败，不再重启", worker_id, self.failures[worker_id])
+                    self.abandoned.add(worker_id)
+                    continue
+            log.error("识别进程%d意外退出（退出码%s），重新启动", worker_id, exitcode)
+            self._spawn(worker_id)
+
+    def close(self):
+        for requests in self.requests:
+            requests.put(None)
+
+    def terminate(self):
+        self.abandoned.update(range(len(self.processes)))
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
@@ -0,0 +1,131 @@
+import io
+import os
+import json
+import zlib
+import queue
+import logging
+import threading
+import numpy as np
+import config
+import metrics
+
+log = logging.getLogger(__name__)
+
+DROPPED = metrics.counter("voice_archive_dropped_total", "归档队列已满丢弃的音频段数")
+
+try:
+    import soundfile
+except ImportError:
+    soundfile = None
+
+def encode(audio, codec, sample_rate=config.RATE):
+    pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16)
+    if codec == "flac":
+        buf = io.BytesIO()
+        soundfile.write(buf, pcm, sample_rate, format="FLAC")
+        return buf.getvalue()
+    return zlib.compress(pcm.tobytes(), 6)
+
+def decode(data, codec):
+    if codec == "flac":
+        pcm, _ = soundfile.read(io.BytesIO(data), dtype="int16")
+    else:
+        pcm = np.frombuffer(zlib.decompress(data), np.int16)
+    return pcm.astype(np.float32) / 32768.0
+
+class AudioArchive:
+    """ 音频归档：每句话的音频单独压缩后追加写入分块文件，在后台线程中进行
+    index.jsonl记录(会话, 音频流, 句子编号)到(文件, 偏移, 长度)的映射，回听某句话时直接定位读取
+    codec为flac（需要soundfile）或zlib（int16 PCM压缩） """
+    def __init__(self, directory=None, chunk_bytes=None, codec=None):
+        self.directory = directory or config.ArchiveDir
+        self.chunk_bytes = chunk_bytes or config.ArchiveChunkBytes
+        self.codec = codec or config.ArchiveCodec
+        if self.codec == "flac" and soundfile is None:
+            log.warning("未安装soundfile，音频归档改用zlib压缩")
+            self.codec = "zlib"
+        os.makedirs(self.directory, exist_ok=True)
+        self.index_path = os.path.join(self.directory, "index.jsonl")
+        self.q = queue.Queue(config.ArchiveQueueSize)
+        self.f = None
+        self.chunk = None
+        self.index = None       # 读取时才加载
+        self.thread = threading.Thread(target=self._run, name="audio-archive", daemon=True)
+        self.thread.start()
+
+    def add(self, session, stream, sentence_id, audio, start=None, end=None):
+        # 在识别流水线中调用，音频需是不再修改的拷贝
+        try:
+            self.q.put_nowait((session, stream, sentence_id, audio, start, end))
+        except queue.Full:
+            DROPPED.inc()
+            log.warning("归档队列已满，丢弃第%d句话的音频", sentence_id)
+
+    def close(self):
+        self.q.put(None)
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            item = self.q.get()
+            if item is None:
+                if self.f is not None:
+                    self.f.close()
+                return
+            try:
+                self._write(*item)
+            except Exception as e:
+                log.error("写入音频归档失败: %r", e)
+
+    def _open_chunk(self, session):
+        # 当前分块写满或会话变化时换一个新文件
+        if self.f is not None and self.chunk[0] == session and self.f.tell() < self.chunk_bytes:
+            return
+        if self.f is not None:
+            self.f.close()
+        n = self.chunk[1] + 1 if self.chunk and self.chunk[0] == session else 0
+        self.chunk = (session, n)
+        self.f = open(os.path.join(self.directory, f"{session}-{n:04d}.{self.codec}.bin"), "ab")
+
+    def _write(self, session, stream, sentence_id, audio, start, end):
+        data = encode(audio, self.codec)
+        self._open_chunk(session)
+        offset = self.f.tell()
+        self.f.write(data)
+        self.f.flush()
+        entry = {
+            "session": session,
+            "stream": stream,
+            "id": sentence_id,
+            "file": os.path.basename(self.f.name),
+            "offset": offset,
+            "length": len(data),
+            "codec": self.codec,
+            "samples": len(audio),
+            "sample_rate": config.RATE,
+            "start": start,
+            "end": end,
+        }
+        with open(self.index_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def load_index(self):
+        index = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, encoding="utf-8") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    index[(entry["session"], entry["stream"], entry["id"])] = entry
+        self.index = index
+        return index
+
+    def read(self, session, stream, sentence_id):
+        """ 读取某句话的音频，返回float32数组 """
+        key = (session, stream, sentence_id)
+        if self.index is None or key not in self.index:
+            self.load_index()
+        entry = self.index[key]
+        with open(os.path.join(self.directory, entry["file"]), "rb") as f:
+            f.seek(entry["offset"])
+            data = f.read(entry["length"])
+        return decode(data, entry["codec"])
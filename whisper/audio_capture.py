@@ -1,129 +1,123 @@
+import time
+import bisect
+import logging
 import config
-import pyaudio
 import queue
-import numpy as np
-import torch
+import metrics
+from collections import deque
+try:
+    import pyaudio
+    PA_CONTINUE = pyaudio.paContinue
+except ImportError:
+    # 回放wav文件时不需要pyaudio
+    PA_CONTINUE = 0
 import voice_to_text
+from pipeline import Pipeline
+from ring_buffer import RingBuffer
+from vad import StreamingVAD, load_vad_model
 
-def get_detect_speech():
-    torch.hub._validate_not_a_forked_repo = lambda a, b, c: True
-    vad_model, funcs = torch.hub.load(
-                repo_or_dir="../silero-vad", model="silero_vad", source="local"
-            )
-    return vad_model, funcs[0]
+log = logging.getLogger(__name__)
+
+VAD_SECONDS = metrics.histogram("voice_vad_seconds", "每个录音块的语音活动检测耗时")
+DROPPED_CHUNKS = metrics.counter("voice_capture_dropped_chunks_total", "录音队列已满丢弃的录音块数")
 
 class AudioCapture:
+    # 一路音频流的分句：录音块通过recording_callback或q送入，run()中检测语音并提交给识别流水线
+    # 录音设备由SessionManager按config.Streams打开
     # is_local-----whisper模型运行在本地还是服务器上
     # f------------websocket服务端的发送函数，将结果实时发送给前端
-    def __init__(self, is_local: bool, f):
-        self.p = pyaudio.PyAudio()
-        self.q = queue.Queue()
-        self.stream = None
-        self.data = b''
-        self.alldata = np.array([],np.float32)  # 存储完整的录音数据
-        self.temp = np.array([],np.float32)     # 存储临时的录音数据
-        self.Recording = False                  # 录音状态标志
-        self.LastEnd = 0                        # 上一段录音的结束位
+    # stream_id----音频流的编号，多路音频同时识别时区分结果来源
+    # pipeline-----共享的识别流水线，为None时单独创建
+    # export_metrics---是否按音频流导出队列长度指标，音频流编号由客户端提供时关闭，避免指标标签无限增长
+    def __init__(self, is_local: bool, f, stream_id=config.DefaultStream, pipeline=None, export_metrics=True):
+        self.q = queue.Queue(config.CaptureQueueSize)
+        self.dropped = 0                        # 因队列已满丢弃的录音块数
+        self.ring = RingBuffer(int(config.RingSeconds * config.RATE))  # 存储录音数据的环形缓冲区
+        # 最近写入的录音块：(写入后缓冲区的结束位置, 写入时间)，用于计算一句话真正说完的时间
+        self.fed = deque(maxlen=int(config.RingSeconds * config.RATE / config.CHUNK) + 1)
+        self.sentence_start = None              # 当前句子在缓冲区中的起始位置
+        self.last_partial = 0                   # 上一次提交中间识别的位置
         self.i = 1                              # 第几句话
-        self.vad_model, self.detect_speech = get_detect_speech()
+        self.vad = StreamingVAD(load_vad_model())
+        if config.WarmUp:
+            self.vad.warmup()
         self.is_local = is_local
-        self.voiceTotext = voice_to_text.VoiceToText(is_local)
-        self.f = f
+        self.stream_id = stream_id
+        if pipeline is None:
+            pipeline = Pipeline(voice_to_text.VoiceToText(is_local), f).start()
+        self.pipeline = pipeline
+        if export_metrics:
+            metrics.gauge("voice_capture_queue_depth", "录音块队列的长度").set_function(self.q.qsize, stream=stream_id)
 
-    def start_capture(self):
-        self.stream = self.p.open(
-            format=config.FORMAT,
-            channels=config.CHANNELS,
-            rate=config.RATE,
-            input=True,
-            input_device_index = config.InputDeviceIndex,
-            frames_per_buffer=config.CHUNK,
-            stream_callback=self.recording_callback
-        )
-        self.stream.start_stream()
+    def run(self):
+        # 处理队列中的录音数据，收到None时结束
         while True:
-            # 从队列中获取录音数据
-            # 确保获取到足够1秒的音频数据
-            while len(self.data) < 2 * config.RATE * 2: 
-                # 获取队列中的数据
-                self.data += self.q.get() 
-            
-            # 将获取到的字节数据转换为numpy数组并归一化
-            self.temp = np.concatenate((self.temp, np.frombuffer(self.data, np.int16).flatten().astype(np.float32) / 32768.0), axis=0)
-            
-            # 检测语音活动
-            speeches = self.detect_speech(self.temp, self.vad_model, sampling_rate=config.RATE)
-            
-            # 打印检测到的语音片段和音频长度
-            print(speeches, len(self.temp)) 
-            
-            # 没有检测到语音
-            if len(speeches) == 0: 
-                if self.Recording:
-                    self.Recording = False
-                    if len(self.alldata) > 0:
-                        print(f"第{self.i}句话翻译完成")
-                        self.i += 1
-                        if self.is_local: 
-                            self.f(self.voiceTotext.recognize_audio_local(self.alldata))
-                        else:
-                            self.f(self.voiceTotext.recognize_audio_server(self.alldata))
-                # 重置变量
-                self.alldata = np.array([], np.float32)
+            chunk = self.q.get()
+            if chunk is None:
+                self.finish_sentence(self.vad.pos)
+                return
 
-            elif len(speeches) == 1: # 检测到一段语音
-                self.Recording = True
-                start, end = int(speeches[0]['start']), int(speeches[0]['end'])
-                self.joint_sentences(start, end, start + self.LastEnd < config.Internal)
+            # 写入缓冲区时直接转换为float32
+            self.ring.write_pcm16(chunk)
+            self.fed.append((self.ring.end, time.time()))
 
-            elif len(speeches) == 2:
-                self.Recording = True
-                start, end = int(speeches[0]['start']), int(speeches[0]['end'])
-                start2, end2 = int(speeches[1]['start']), int(speeches[1]['end'])
+            # 逐帧检测语音活动，VAD的状态在帧之间保留
+            vad_start = time.perf_counter()
+            while self.ring.end - self.vad.pos >= self.vad.frame:
+                event = self.vad.process(self.ring.read(self.vad.pos, self.vad.pos + self.vad.frame))
+                if event is None:
+                    pass
+                elif 'start' in event:
+                    log.debug("[%s] 这是第%d句话", self.stream_id, self.i)
+                    self.sentence_start = event['start']
+                    self.last_partial = self.vad.pos
+                else:
+                    self.finish_sentence(event['end'])
 
-                # 获取并添加第一句话之后再处理
-                if start + self.LastEnd < config.Internal:
-                    # 这是一句话
-                    self.alldata = np.concatenate((self.alldata, self.temp[start:end]), axis=0)
-                    self.joint_sentences(start2, end2, start2 - end < config.Internal)
+                # 句子过长时直接截断处理，避免超出缓冲区和whisper的30秒窗口
+                if self.sentence_start is not None and \
+                        self.vad.pos - self.sentence_start >= config.MaxSentenceSeconds * config.RATE:
+                    self.finish_sentence(self.vad.pos)
+                    self.sentence_start = self.vad.pos
+            VAD_SECONDS.observe(time.perf_counter() - vad_start)
 
-                else:
-                    # 这是两句话
-                    if len(self.alldata) > 0:
-                        print(f"第{self.i}句话翻译完成")
-                        self.i += 1
-                        if self.is_local: 
-                            self.f(self.voiceTotext.recognize_audio_local(self.alldata))
-                        else:
-                            self.f(self.voiceTotext.recognize_audio_server(self.alldata))
-                    self.alldata = self.temp[start:end]
-                    self.joint_sentences(start2, end2, start2 - end < config.Internal)
-            
-            # 清空data和temp，继续录音
-            self.data = b''
-            self.temp = np.array([],np.float32)
+            # 句子还没结束时定期提交中间识别
+            self.submit_partial()
 
+    def submit_partial(self):
+        if not self.is_local or config.PartialInterval <= 0 or self.sentence_start is None:
+            return
+        if self.vad.pos - self.last_partial < config.PartialInterval * config.RATE:
+            return
+        self.last_partial = self.vad.pos
+        start = max(self.sentence_start, self.ring.start)
+        if self.vad.pos - start >= config.PartialMinSeconds * config.RATE:
+            self.pipeline.submit_partial(self.i, self.ring.read(start, self.vad.pos), self.stream_id)
 
     def recording_callback(self, in_data, frame_count, time_info, status):
-        self.q.put(in_data)
-        return (None, pyaudio.paContinue)
-    
-    def joint_sentences(self, start, end, isJoint):
-        if isJoint:
-            # 这是一句话
-            self.alldata = np.concatenate((self.alldata, self.temp[start:end]), axis=0)
+        # 录音回调不能阻塞，队列满时丢弃录音块
+        try:
+            self.q.put_nowait(in_data)
+        except queue.Full:
+            self.dropped += 1
+            DROPPED_CHUNKS.inc(stream=self.stream_id)
+        return (None, PA_CONTINUE)
 
-        else:
-            # 这是两句话
-            # 先处理前一句话
-            if len(self.alldata) > 0:
-                print(f"第{self.i}句话翻译完成")
-                self.i += 1
-                if self.is_local: 
-                    self.f(self.voiceTotext.recognize_audio_local(self.alldata))
-                else:
-                    self.f(self.voiceTotext.recognize_audio_server(self.alldata))
-            self.alldata = self.temp[start:end]
+    def fed_time(self, pos):
+        # 采样位置pos写入缓冲区的时间，VAD在静音持续一段时间后才判断句子结束，不能用判断时的时间
+        i = bisect.bisect_left(self.fed, (pos,))
+        return self.fed[i][1] if i < len(self.fed) else time.time()
 
-        print(f"这是第{self.i}句话")
-        self.LastEnd = len(self.temp[end:])
\ No newline at end of file
+    def finish_sentence(self, end):
+        if self.sentence_start is None:
+            return
+        start = max(self.sentence_start, self.ring.start)
+        self.sentence_start = None
+        end = min(end, self.ring.end)
+        if end <= start:
+            return
+        audio = self.ring.read(start, end)
+        # 交给识别流水线异步处理，录音线程继续检测
+        log.info("[%s] 第%d句话录音完成", self.stream_id, self.i)
+        self.pipeline.submit(self.i, audio, self.stream_id, (start, end), self.fed_time(end))
+        self.i += 1
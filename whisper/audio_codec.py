@@ -0,0 +1,55 @@
+import struct
+import zlib
+import numpy as np
+
+# 二进制音频格式：固定长度的头部 + PCM数据
+# 头部：魔数、版本、数据类型、标志位、采样率、句子编号、采样点数
+HEADER = struct.Struct("<4sBBBxIQI")
+MAGIC = b"VPCM"
+VERSION = 1
+FLAG_ZLIB = 1
+
+DTYPES = {1: np.int16, 2: np.float32}
+DTYPE_CODES = {"int16": 1, "float32": 2}
+
+CONTENT_TYPE = "application/octet-stream"
+
+def encode(audio, sentence_id=0, sample_rate=16000, dtype="int16", compress=False):
+    """ 将float32音频编码为二进制数据，int16格式体积减半 """
+    if dtype == "int16":
+        pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype(np.int16)
+    else:
+        pcm = np.ascontiguousarray(audio, np.float32)
+    payload = pcm.tobytes()
+    flags = 0
+    if compress:
+        payload = zlib.compress(payload, 1)
+        flags |= FLAG_ZLIB
+    header = HEADER.pack(MAGIC, VERSION, DTYPE_CODES[dtype], flags, sample_rate, sentence_id, len(pcm))
+    return header + payload
+
+def decode(data):
+    """ 解码二进制音频，返回头部信息和float32音频
+    未压缩的float32数据直接引用原始缓冲区，不做拷贝 """
+    view = memoryview(data)
+    if len(view) < HEADER.size:
+        raise ValueError("音频数据长度不足")
+    magic, version, dtype_code, flags, sample_rate, sentence_id, n = HEADER.unpack_from(view)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("无法识别的音频格式")
+    if dtype_code not in DTYPES:
+        raise ValueError(f"未知的数据类型: {dtype_code}")
+    payload = view[HEADER.size:]
+    if flags & FLAG_ZLIB:
+        try:
+            payload = zlib.decompress(payload)
+        except zlib.error as e:
+            raise ValueError(f"音频数据解压失败: {e}") from None
+    pcm = np.frombuffer(payload, DTYPES[dtype_code], count=n)
+    if pcm.dtype == np.int16:
+        audio = pcm.astype(np.float32)
+        audio /= 32768.0
+    else:
+        audio = pcm
+    info = {"id": sentence_id, "sample_rate": sample_rate, "samples": n}
+    return info, audio
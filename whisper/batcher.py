@@ -0,0 +1,69 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import config
+import metrics
+
+BATCH_SIZE = metrics.histogram("voice_batch_size", "每个批次合并的请求数", (1, 2, 4, 8, 16, 32))
+BATCH_SECONDS = metrics.histogram("voice_batch_decode_seconds", "每个批次的解码耗时")
+
+class DecodeBatcher:
+    """ 动态批处理：在很短的等待窗口内收集并发的识别请求，合并为一个批次统一解码
+    decode_batch-----输入音频列表和解码参数(language, prompt)，返回对应的结果列表
+                     只按语言分组：每路音频流的prompt都不同，按prompt分组会让不同音频流的请求无法合并
+                     批次中只有一个请求时使用它的prompt；多个请求合并解码时不使用prompt，
+                     负载高时优先保证吞吐量，前文一致性只在请求较少时生效
+    workers----------同时解码的批次数，识别引擎运行在多个进程中时与进程数相同
+    submit的group不为None时传给decode_batch(groups=...)，只有同一组的音频会被打包进同一个30秒窗口 """
+    def __init__(self, decode_batch, max_batch=config.BatchMaxSize, max_delay=config.BatchMaxDelay, workers=1):
+        self.decode_batch = decode_batch
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.q = queue.Queue()
+        for n in range(workers):
+            threading.Thread(target=self._run, name=f"decode-batcher-{n}", daemon=True).start()
+
+    def submit(self, audio, language=None, prompt=None, group=None) -> Future:
+        future = Future()
+        self.q.put((audio, language, prompt, group, future))
+        return future
+
+    def _collect(self):
+        # 拿到第一个请求后最多再等待max_delay秒
+        batch = [self.q.get()]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.q.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            groups = {}
+            for audio, language, prompt, group, future in self._collect():
+                groups.setdefault(language, []).append((audio, prompt, group, future))
+            for language, batch in groups.items():
+                self._decode(batch, language)
+
+    def _decode(self, batch, language):
+        futures = [future for _, _, _, future in batch]
+        prompt = batch[0][1] if len(batch) == 1 else None
+        options = {"language": language, "prompt": prompt}
+        if any(group is not None for _, _, group, _ in batch):
+            options["groups"] = [group for _, _, group, _ in batch]
+        BATCH_SIZE.observe(len(batch))
+        try:
+            with BATCH_SECONDS.time():
+                results = self.decode_batch([audio for audio, _, _, _ in batch], **options)
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+        for future, result in zip(futures, results):
+            future.set_result(result)
@@ -0,0 +1,68 @@
+# 比较不同识别引擎在本机上的速度，选择最快的config.AsrEngine
+# 用法：python benchmark_asr.py sample.wav --engines torch torch-int8 ct2-int8 onnx --model tiny
+import argparse
+import time
+import wave
+import numpy as np
+import config
+import asr_backend
+
+def read_wav(path):
+    with wave.open(path, "rb") as f:
+        if f.getsampwidth() != 2 or f.getframerate() != config.RATE:
+            raise ValueError(f"需要{config.RATE}Hz 16bit的wav文件")
+        pcm = np.frombuffer(f.readframes(f.getnframes()), np.int16)
+        pcm = pcm.reshape(-1, f.getnchannels())[:, 0]
+    return pcm.astype(np.float32) / 32768.0
+
+def split_sentences(audio, seconds):
+    step = int(seconds * config.RATE)
+    return [audio[i:i + step] for i in range(0, len(audio), step) if len(audio[i:i + step]) > config.RATE // 2]
+
+def bench(engine, model_name, sentences, repeat):
+    start = time.time()
+    backend = asr_backend.create_backend(engine, model_name)
+    load = time.time() - start
+
+    # 预热一次，不计入结果
+    backend.transcribe_batch(sentences[:1])
+
+    costs = []
+    for _ in range(repeat):
+        for sentence in sentences:
+            start = time.time()
+            backend.transcribe_batch([sentence])
+            costs.append(time.time() - start)
+    audio_seconds = sum(len(s) for s in sentences) / config.RATE * repeat
+    return {
+        "engine": engine,
+        "load": load,
+        "p50": float(np.percentile(costs, 50)),
+        "p95": float(np.percentile(costs, 95)),
+        "rtf": sum(costs) / audio_seconds,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="识别引擎性能对比")
+    parser.add_argument("wav", help=f"{config.RATE}Hz 16bit的wav文件")
+    parser.add_argument("--engines", nargs="+", default=list(asr_backend.ENGINES))
+    parser.add_argument("--model", default=config.VoiceToWordModel)
+    parser.add_argument("--sentence", type=float, default=5.0, help="每句话的长度（秒）")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    sentences = split_sentences(read_wav(args.wav), args.sentence)
+    results = []
+    for engine in args.engines:
+        try:
+            results.append(bench(engine, args.model, sentences, args.repeat))
+        except Exception as e:
+            print(f"❌ {engine} 不可用:", repr(e))
+
+    print(f"模型: {args.model}, 句子数: {len(sentences)}, 每句{args.sentence}s")
+    print(f"{'engine':<12}{'load(s)':>10}{'p50(s)':>10}{'p95(s)':>10}{'RTF':>10}")
+    for r in sorted(results, key=lambda r: r["rtf"]):
+        print(f"{r['engine']:<12}{r['load']:>10.2f}{r['p50']:>10.3f}{r['p95']:>10.3f}{r['rtf']:>10.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+# 批量转录录音文件：流式解码（不把整个文件读入内存）→ silero VAD分句 → 多进程识别 → 翻译
+# 每个文件输出一个JSONL转录文件，格式与实时转录相同；manifest.jsonl记录已完成的文件，中断后重新运行会跳过它们
+# 用法：python bulk_transcribe.py recordings/ --out-dir transcripts --processes 4
+# 非wav格式需要安装ffmpeg
+import os
+import sys
+import json
+import time
+import wave
+import argparse
+import threading
+import subprocess
+import config
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".m4a", ".flac", ".ogg", ".opus", ".aac", ".mp4", ".mkv", ".webm")
+
+def find_files(inputs):
+    files = []
+    for path in inputs:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files += [os.path.join(root, n) for n in sorted(names) if n.lower().endswith(AUDIO_EXTENSIONS)]
+        else:
+            files.append(path)
+    return files
+
+def read_pcm(path, chunk_bytes=config.CHUNK * 2):
+    """ 逐块读取16kHz单声道int16 PCM，wav文件直接读取，其他格式通过ffmpeg解码 """
+    if path.lower().endswith(".wav"):
+        with wave.open(path, "rb") as f:
+            if f.getsampwidth() == 2 and f.getframerate() == config.RATE and f.getnchannels() == 1:
+                while True:
+                    data = f.readframes(chunk_bytes // 2)
+                    if not data:
+                        return
+                    yield data
+    cmd = ["ffmpeg", "-nostdin", "-loglevel", "error", "-i", path,
+           "-f", "s16le", "-ac", "1", "-ar", str(config.RATE), "-"]
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE) as proc:
+        while True:
+            data = proc.stdout.read(chunk_bytes)
+            if not data:
+                break
+            yield data
+        if proc.wait() != 0:
+            raise RuntimeError(f"ffmpeg解码失败: {path}")
+
+class Manifest:
+    """ 已完成文件的记录，文件大小和修改时间不变时跳过 """
+    def __init__(self, path):
+        self.path = path
+        self.done = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self.done[entry["file"]] = entry
+
+    @staticmethod
+    def key(path):
+        st = os.stat(path)
+        return {"file": os.path.abspath(path), "size": st.st_size, "mtime": st.st_mtime}
+
+    def is_done(self, path):
+        key = self.key(path)
+        entry = self.done.get(key["file"])
+        return entry is not None and entry["size"] == key["size"] and entry["mtime"] == key["mtime"]
+
+    def mark(self, path, **info):
+        entry = {**self.key(path), **info}
+        self.done[entry["file"]] = entry
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+class RecordCollector:
+    """ 代替TranscriptWriter接收转录记录，按文件分组 """
+    def __init__(self):
+        self.records = {}
+        self.lock = threading.Lock()
+
+    def write(self, record):
+        with self.lock:
+            self.records.setdefault(record["stream"], []).append(record)
+
+    def pop(self, stream):
+        with self.lock:
+            return sorted(self.records.pop(stream, []), key=lambda r: r["start"] or 0)
+
+    def close(self):
+        pass
+
+def output_path(out_dir, path):
+    name = os.path.splitext(os.path.relpath(os.path.abspath(path)).replace(os.sep, "__"))[0]
+    return os.path.join(out_dir, name.lstrip(".") + ".jsonl")
+
+def feed(capture, path, result):
+    # 读取文件送入分句队列，队列满时等待，不丢数据
+    samples = 0
+    try:
+        for data in read_pcm(path):
+            capture.q.put(data)
+            samples += len(data) // 2
+    except Exception as e:
+        result["error"] = repr(e)
+    finally:
+        capture.q.put(None)
+        result["seconds"] = samples / config.RATE
+
+def main():
+    parser = argparse.ArgumentParser(description="批量转录录音文件")
+    parser.add_argument("inputs", nargs="+", help="音频文件或目录")
+    parser.add_argument("--out-dir", default="transcripts")
+    parser.add_argument("--processes", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="识别进程数")
+    parser.add_argument("--jobs", type=int, default=0, help="同时处理的文件数，默认是识别进程数的2倍")
+    parser.add_argument("--translate", nargs="*", choices=("tencent", "google", "local", "stub"),
+                        default=config.TranslateProviders, help="翻译接口，默认使用config.TranslateProviders，只写--translate不带接口名时不翻译")
+    parser.add_argument("--engine", help="识别引擎，默认使用config.AsrEngine")
+    parser.add_argument("--model", help="识别模型，默认使用config.VoiceToWordModel")
+    args = parser.parse_args()
+
+    # 在导入识别流程之前修改配置：不做中间识别，队列满时等待而不是丢弃
+    config.PartialInterval = 0
+    config.AsrPolicy = "block"
+    config.TranslatePolicy = "block"
+    config.AsrProcesses = args.processes
+    config.AsrWorkers = max(config.AsrWorkers, args.processes * config.BatchMaxSize)
+    config.TranslateProviders = args.translate
+    config.FileName = None
+    if args.engine:
+        config.AsrEngine = args.engine
+    if args.model:
+        config.VoiceToWordModel = args.model
+
+    import logging
+    logging.basicConfig(level=config.LogLevel, format=config.LogFormat)
+    import voice_to_text
+    from pipeline import Pipeline
+    from audio_capture import AudioCapture
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    manifest = Manifest(os.path.join(args.out_dir, "manifest.jsonl"))
+    files = [path for path in find_files(args.inputs) if not manifest.is_done(path)]
+    print(f"待处理文件: {len(files)}")
+    if not files:
+        return
+
+    collector = RecordCollector()
+    pipeline = Pipeline(voice_to_text.VoiceToText(True), lambda message: None, collector).start()
+    jobs = args.jobs or args.processes * 2
+    started = time.time()
+    total_seconds = 0.0
+
+    # 每批同时处理jobs个文件，所有句子处理完后再写出结果并记录到manifest
+    for i in range(0, len(files), jobs):
+        wave_files = files[i:i + jobs]
+        results = {path: {} for path in wave_files}
+        threads = []
+        for path in wave_files:
+            capture = AudioCapture(True, None, os.path.abspath(path), pipeline, export_metrics=False)
+            threads.append(threading.Thread(target=feed, args=(capture, path, results[path]), daemon=True))
+            threads.append(threading.Thread(target=capture.run, daemon=True))
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        pipeline.join()
+
+        for path in wave_files:
+            records = collector.pop(os.path.abspath(path))
+            if "error" in results[path]:
+                print(f"❌ {path}: {results[path]['error']}", file=sys.stderr)
+                continue
+            out = output_path(args.out_dir, path)
+            with open(out + ".tmp", "w", encoding="utf-8") as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            os.replace(out + ".tmp", out)
+            manifest.mark(path, output=out, sentences=len(records), seconds=results[path]["seconds"])
+            total_seconds += results[path]["seconds"]
+            print(f"✓ {path} -> {out}（{len(records)}句）")
+
+    pipeline.close()
+    wall = time.time() - started
+    print(f"完成：音频{total_seconds:.1f}s，耗时{wall:.1f}s，实时率{wall / max(total_seconds, 1e-6):.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,62 @@
-import pyaudio
+try:
+    import pyaudio
+except ImportError:
+    # 回放wav文件时不需要pyaudio
+    pyaudio = None
 
-# 设定的说话间隔时间
+# 设定的说话间隔时间（采样点），静音超过该长度认为一句话结束
 Internal = 8000
 
+# 语音活动检测的阈值
+VadThreshold = 0.5
+
+# 语音片段前后补充的采样点数
+SpeechPad = 480
+
 # 指定音频转文字模型
 # 可选模型有：tiny, base, small, medium, large
 VoiceToWordModel = 'tiny'
 
+# 语音识别引擎，可以用benchmark_asr.py选择本机最快的引擎
+# torch------------openai-whisper + PyTorch
+# torch-int8-------PyTorch动态int8量化（CPU）
+# ct2-int8---------faster-whisper（CTranslate2）int8（CPU）
+# onnx-------------ONNX Runtime
+AsrEngine = "torch"
+
+# 识别引擎使用的CPU线程数，0表示自动
+AsrThreads = 0
+
+# 识别进程数，大于0时在多个子进程中同时解码，充分利用CPU的所有核心
+# torch引擎的权重转换为fp32后保存在ModelCacheDir中，各进程通过mmap共享同一份内存
+# AsrThreadsPerProcess为每个进程的线程数，0表示CPU核数平均分配
+AsrProcesses = 0
+AsrThreadsPerProcess = 0
+AsrPoolTimeout = 60         # 等待空闲识别进程的最长时间（秒），进程全部退出时不会一直等待
+AsrPoolMaxRestarts = 3      # 识别进程连续多少次加载模型失败后不再重启
+
+# 模型缓存目录，CacheModels为True时把转换后的模型保存在这里，之后直接加载
+ModelCacheDir = "model_cache"
+CacheModels = True
+
+# 启动时先用静音预热VAD和识别模型，让第一句话的耗时与之后一致
+WarmUp = True
+
 # 源语言
 SourceLanguage = "en"
 
 # 目的语言
 TargetLanguage = "zh"
 
+# 识别时使用的语言，None表示自动检测，检测结果的概率超过LanguageLockProb后锁定
+AsrLanguage = SourceLanguage
+LanguageLockProb = 0.8
+
+# 把最近PromptSentences句话（最多PromptMaxChars个字符）作为下一句的prompt，保持前后文一致
+# 多个请求合并为一个批次解码时不使用prompt（见batcher.py），prompt只在单独解码时生效
+PromptSentences = 3
+PromptMaxChars = 200
+
 # 监听的音频设备
 # windows一般是13，linux一般是pulse
 # windows一般选择第二个CABLE OUTPUT设备
@@ -25,16 +69,140 @@ IS_LOCAL = True  # 是否在本地运行翻译服务
 # 指定翻译服务器
 SERVER = "http://192.168.186.31:8000/translate"
 
+# 远程模式下是否通过WebSocket把录音连续发送到服务器，由服务器分句和识别（本地不需要torch和VAD）
+# STREAM_SERVER-----------server.py的流式识别接口
+# StreamReconnectDelay----连接断开后重连的等待时间（秒）
+StreamToServer = False
+STREAM_SERVER = "ws://192.168.186.31:8000/stream"
+StreamReconnectDelay = 1
+StreamBacklog = 4           # 服务器上每个流式连接最多积压的句子数，超过时丢弃新的句子
+
+# 服务器动态批处理：每批最多的请求数，收集请求的最长等待时间（秒）
+BatchMaxSize = 8
+BatchMaxDelay = 0.01
+
+# 服务器的多会话公平调度：每个客户端（按连接的对端地址区分）有独立的队列，按音频时长加权轮流解码
+# 请求头X-Session只区分同一客户端内的会话，在该客户端的份额内轮流；不同客户端的音频不会打包进同一个窗口
+# SchedulerInflight-----同时交给batcher解码的请求数
+# SchedulerMaxPending---所有会话排队的请求总数上限，超过时返回429和Retry-After
+# SessionQueueSize------每个会话排队的请求数上限，超过时返回429
+# SessionInflight-------每个会话同时解码的请求数上限
+# SchedulerMaxWait------请求排队超过该时间（秒）后不再解码，返回429
+# SessionWeights--------各客户端（对端地址）的权重，默认为1，例如 {"10.0.0.5": 0.5}
+SchedulerInflight = BatchMaxSize * 2
+SchedulerMaxPending = 64
+SessionQueueSize = 8
+SessionInflight = 2
+SchedulerMaxWait = 10
+SessionWeights = {}
+
+# 是否把多个短句打包进同一个30秒窗口解码，whisper的编码器只接受30秒的输入
+# PackGap-----------短句之间插入的静音（秒），便于按时间戳拆分结果
+# PackMaxSeconds----超过该长度的句子单独解码
+PackSentences = True
+PackGap = 1.0
+PackMaxSeconds = 10
+
+# 上传到服务器的音频格式：int16 或 float32，是否使用zlib压缩
+ServerAudioDtype = "int16"
+ServerAudioCompress = False
+
+# 请求服务器的超时时间（秒）
+ServerTimeout = 30
+
+# 录音环形缓冲区的长度（秒），需大于单句话的最大长度
+RingSeconds = 60
+
+# 单句话的最大长度（秒），whisper每次最多处理30秒音频
+MaxSentenceSeconds = 30
+
 # 配置录音参数
 CHUNK = 1024
-FORMAT = pyaudio.paInt16
+FORMAT = pyaudio.paInt16 if pyaudio else 8
 CHANNELS = 1
 RATE = 16000
 
+# 同时识别的音频输入，每个输入可以是单声道设备，也可以是按声道拆分的多声道设备
+# device-----设备索引
+# channels---设备的声道数
+# streams----每个声道对应的音频流编号，结果中用stream字段区分说话人
+DefaultStream = "default"
+Streams = [
+    {"device": InputDeviceIndex, "channels": 1, "streams": [DefaultStream]},
+    # 例：一个双声道设备，左右声道分别是采访者和受访者
+    # {"device": 37, "channels": 2, "streams": ["interviewer", "interviewee"]},
+]
+
+# 一句话还没说完时，每隔PartialInterval秒识别一次并发送中间结果，0表示关闭（仅本地模式）
+# 句子短于PartialMinSeconds秒时不做中间识别
+PartialInterval = 1.0
+PartialMinSeconds = 1.0
+PartialQueueSize = 4    # 中间识别的任务队列，满时丢弃最旧的任务；每路音频流只识别最新的快照，过时的快照不解码
+
+# 识别流水线的配置
+# 队列满时的策略：block（等待）/ drop_newest（丢弃新任务）/ drop_oldest（丢弃最旧的任务）
+CaptureQueueSize = 256      # 录音块队列，满时丢弃新录音块
+AsrWorkers = 4              # 语音识别的线程数，多个线程提交的句子会合并解码
+AsrQueueSize = 8
+AsrPolicy = "drop_oldest"
+TranslateWorkers = 2        # 翻译的线程数
+TranslateQueueSize = 32
+TranslatePolicy = "block"
+TranslateBatchSize = 8      # 每次批量翻译最多的句子数
+TranslateBatchDelay = 0.2   # 收集待翻译句子的最长等待时间（秒）
+DeliveryQueueSize = 64
+
+# WebSocket 每个连接的发送队列长度和发送超时（秒），超出后断开该连接
+WsQueueSize = 64
+WsSendTimeout = 5
+
+# 日志级别：DEBUG / INFO / WARNING / ERROR
+LogLevel = "INFO"
+LogFormat = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
 PROXY = {
     "http": "http://127.0.0.1:7890",
     "https": "http://127.0.0.1:7890"
 }
 
-FileName = "Rybakina_Interview.txt"  # 保存转录文本的文件名
+# 翻译接口，按顺序使用，为空表示不翻译
+# tencent（腾讯API）、google（谷歌网页接口）、local（本地离线翻译模型）、stub（本地模拟翻译，用于回放测试）
+# 前一个接口在对冲等待时间内没有返回时同时请求下一个接口，使用最先返回的结果
+# 所有接口都失败时只发送原文
+TranslateProviders = ["tencent", "google"]
+TranslateTimeout = 5                            # 默认的超时（秒）
+TranslateTimeouts = {"tencent": 3, "google": 3, "local": 10}
+TranslateHedgeQuantile = 0.95                   # 对冲等待时间为接口最近耗时的p95
+TranslateHedgeMin = 0.3                         # 对冲等待时间的上下限（秒）
+TranslateHedgeMax = 2.0
+TranslateBreakerFailures = 3                    # 连续失败多少次后熔断
+TranslateBreakerCooldown = 30                   # 熔断后多久再试探（秒）
+TranslateProviderThreads = 8                    # 每个翻译接口的线程数
+LocalTranslateModel = "Helsinki-NLP/opus-mt-en-zh"  # 本地离线翻译模型（transformers）
+StubTranslateDelay = 0.0    # 模拟翻译的耗时（秒）
+
+# 翻译结果缓存：内存中最多缓存的条数，过期时间（秒，0表示不过期），持久化的SQLite文件（None表示不持久化）
+TranslateCacheSize = 10000
+TranslateCacheTTL = 30 * 24 * 3600
+TranslateCacheFile = "translate_cache.db"
+
+FileName = "Rybakina_Interview.jsonl"  # 保存转录记录的文件名，每行一个JSON
+
+# 是否归档每句话的音频，保存在ArchiveDir中，index.jsonl记录每句话所在的文件和偏移
+# ArchiveCodec：flac（需要安装soundfile）或 zlib；每个分块文件超过ArchiveChunkBytes后换新文件
+ArchiveAudio = False
+ArchiveDir = "audio_archive"
+ArchiveCodec = "flac"
+ArchiveChunkBytes = 64 * 1024 * 1024
+ArchiveQueueSize = 256
+
+# 转录文件在后台批量写入：攒够TranscriptFlushSize条或每隔TranscriptFlushInterval秒写入一次
+# 超过TranscriptMaxBytes字节时轮转（0表示不轮转），保留TranscriptBackups个旧文件
+# fsync策略：none（不调用）/ flush（每次写入后）/ rotate（只在轮转时）
+TranscriptFlushInterval = 1.0
+TranscriptFlushSize = 32
+TranscriptMaxBytes = 50 * 1024 * 1024
+TranscriptBackups = 5
+TranscriptFsync = "none"
+TranscriptQueueSize = 1024
 
@@ -0,0 +1,43 @@
+import bisect
+import threading
+import config
+
+class DecodingContext:
+    """ 会话级的解码上下文（每路音频流一个）
+    - 指定了语言或自动检测的结果足够可信后锁定语言，之后不再逐句检测
+    - 保留最近几句话作为下一句的prompt，保持前后文一致
+    多个识别线程同时处理同一路音频时，句子完成的顺序与说话的顺序不同，
+    因此按句子编号排序保存，第N句的prompt只包含编号小于N的句子 """
+    def __init__(self, language=None, sentences=None, max_chars=None):
+        self.language = language if language is not None else config.AsrLanguage
+        self.sentences = sentences or config.PromptSentences
+        self.history = []       # [(句子编号, 文本)]，按编号排序
+        self.max_chars = max_chars or config.PromptMaxChars
+        self.lock = threading.Lock()
+
+    @property
+    def prompt(self):
+        return self.prompt_before(None)
+
+    def prompt_before(self, sentence_id):
+        # sentence_id为None时使用全部历史
+        with self.lock:
+            texts = [text for i, text in self.history if sentence_id is None or i < sentence_id]
+        text = " ".join(texts[-self.sentences:])
+        return text[-self.max_chars:].lstrip() or None
+
+    def detected(self, language, probability):
+        # 检测结果的概率超过阈值时锁定语言
+        if self.language is None and language and probability >= config.LanguageLockProb:
+            self.language = language
+
+    def add(self, text, sentence_id=None):
+        # sentence_id为None时追加在最后
+        text = text.strip()
+        if text:
+            with self.lock:
+                if sentence_id is None:
+                    sentence_id = self.history[-1][0] + 1 if self.history else 0
+                bisect.insort(self.history, (sentence_id, text))
+                # 多保留几句，迟到的较早句子仍然可以插入到正确的位置
+                del self.history[:-self.sentences * 2]
@@ -1,64 +1,68 @@
-import audio_capture
+import logging
 import threading
 from fastapi import FastAPI, WebSocket
+from fastapi.responses import JSONResponse, Response
 import uvicorn
 import asyncio
-import audio_capture
 import config
+import metrics
+from ws_hub import ConnectionHub
+
+logging.basicConfig(level=config.LogLevel, format=config.LogFormat)
+
+# 模型加载和预热完成后置位
+ready = threading.Event()
+manager = None      # 后台线程创建的SessionManager
+
+def status_message():
+    return {"type": "status", "ready": ready.is_set()}
 
 def backend():
     # 启动 FastAPI 应用
-    ac = audio_capture.AudioCapture(config.IS_LOCAL, send_in_thread)
-    ac.start_capture()
+    # torch、whisper等在后台线程中导入，WebSocket服务可以先启动
+    global manager
+    import session_manager
+    # 按config.Streams打开所有音频输入
+    manager = session_manager.SessionManager(config.IS_LOCAL, send_in_thread)
+    ready.set()
+    send_in_thread(status_message())
+    manager.start()
 
 app = FastAPI()
 
-# 用来保存 WebSocket 连接
-ws_client = None
-loop = None
+# 管理所有 WebSocket 连接
+hub = ConnectionHub()
 
 @app.websocket("/ws")
 async def websocket_endpoint(ws: WebSocket):
-    global ws_client
     await ws.accept()  # 接受连接
-    ws_client = ws     # 保存连接对象
-    try:
-        while True:
-            msg = await ws.receive_text()  # 接收消息
-            print(f"收到客户端消息: {msg}")
-    except:
-        print("客户端断开连接")
-        ws_client = None
-
-def send_in_thread(message):
-    global ws_client, loop
-    if ws_client is None:
-        print("⚠️ ws_client 还未连接，消息丢弃", flush=True)
-        return
+    await ws.send_json(status_message())  # 告知前端后端是否就绪
+    await hub.serve(ws)
 
-    if loop is None:
-        print("❌ loop 为空，无法发送", flush=True)
-        return
+@app.get("/ready")
+def get_ready():
+    return JSONResponse(status_message(), status_code=200 if ready.is_set() else 503)
 
-    print("✅ 准备通过 WebSocket 发送消息", flush=True)
+@app.get("/metrics")
+def get_metrics():
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
 
-    future = asyncio.run_coroutine_threadsafe(
-        ws_client.send_json(message),
-        loop
-    )
-
-    # 捕获真正的异常（关键！）
-    try:
-        future.result(timeout=1)
-        print("✅ WebSocket 消息发送成功", flush=True)
-    except Exception as e:
-        print("❌ WebSocket 发送失败:", repr(e), flush=True)
+def send_in_thread(message):
+    # 在工作线程中调用，不等待网络发送
+    hub.publish_threadsafe(message)
 
 @app.on_event("startup")
 def on_startup():
-    global loop
-    loop = asyncio.get_event_loop()
+    hub.bind(asyncio.get_event_loop())
 
     t = threading.Thread(target=backend, daemon=True)
     t.start()
-uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+
+@app.on_event("shutdown")
+def on_shutdown():
+    # 退出前写完转录文件和音频归档
+    if manager is not None:
+        manager.pipeline.close()
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="0.0.0.0", port=8001)
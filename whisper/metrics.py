@@ -0,0 +1,125 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+# 延迟直方图默认的分桶（秒）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+def _labels_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+class Counter:
+    def __init__(self, name, help):
+        self.name, self.help, self.type = name, help, "counter"
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, key, value) for key, value in self.values.items()]
+
+class Gauge(Counter):
+    """ 可以直接设置数值，或者在导出时调用函数取值（例如队列长度） """
+    def __init__(self, name, help):
+        super().__init__(name, help)
+        self.type = "gauge"
+        self.functions = {}
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[tuple(sorted(labels.items()))] = value
+
+    def set_function(self, func, **labels):
+        with self.lock:
+            self.functions[tuple(sorted(labels.items()))] = func
+
+    def samples(self):
+        samples = super().samples()
+        with self.lock:
+            functions = list(self.functions.items())
+        return samples + [(self.name, key, func()) for key, func in functions]
+
+class Histogram:
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.type = name, help, "histogram"
+        self.buckets = tuple(buckets)
+        self.values = {}    # 标签 -> [各分桶计数, 总和, 总数]
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts, total, n = self.values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            if i < len(counts):
+                counts[i] += 1
+            self.values[key] = (counts, total + value, n + 1)
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            items = [(key, list(counts), total, n) for key, (counts, total, n) in self.values.items()]
+        for key, counts, total, n in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                samples.append((self.name + "_bucket", key + (("le", bound),), cumulative))
+            samples.append((self.name + "_bucket", key + (("le", "+Inf"),), n))
+            samples.append((self.name + "_sum", key, total))
+            samples.append((self.name + "_count", key, n))
+        return samples
+
+class Registry:
+    """ 指标注册表，同名指标只创建一次，render导出Prometheus文本格式 """
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _get(self, cls, name, help, *args):
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = cls(name, help, *args)
+            return self.metrics[name]
+
+    def counter(self, name, help):
+        return self._get(Counter, name, help)
+
+    def gauge(self, name, help):
+        return self._get(Gauge, name, help)
+
+    def histogram(self, name, help, buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help, buckets)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            metrics = list(self.metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_labels_text(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
@@ -0,0 +1,107 @@
+import numpy as np
+import config
+import metrics
+
+REDECODED = metrics.counter("voice_pack_redecoded_total", "打包解码的结果无法分配、单独重新解码的句子数")
+
+# whisper每个窗口固定为30秒
+WINDOW_SECONDS = 30
+TIME_PRECISION = 0.02   # whisper时间戳的精度（秒）
+
+def pad_or_trim(audio, sample_rate=config.RATE):
+    # 补齐或截断为一个30秒窗口
+    window = WINDOW_SECONDS * sample_rate
+    out = np.zeros(window, np.float32)
+    n = min(len(audio), window)
+    out[:n] = audio[:n]
+    return out
+
+def pack(audios, sample_rate=config.RATE, gap=config.PackGap, max_seconds=config.PackMaxSeconds):
+    """ 把多段短音频依次拼接到30秒窗口中，段与段之间留出静音间隔
+    返回窗口列表，以及每段音频所在的(窗口编号, 起始秒, 结束秒) """
+    window = WINDOW_SECONDS * sample_rate
+    gap = int(gap * sample_rate)
+    windows, spans = [], []
+    current, pos = None, 0
+    for audio in audios:
+        n = min(len(audio), window)
+        # 较长的音频单独占用一个窗口
+        if current is None or pos + n > window or n > max_seconds * sample_rate:
+            current = np.zeros(window, np.float32)
+            windows.append(current)
+            pos = 0
+        current[pos:pos + n] = audio[:n]
+        spans.append((len(windows) - 1, pos / sample_rate, (pos + n) / sample_rate))
+        pos += n + gap
+        if n > max_seconds * sample_rate:
+            current = None
+    return windows, spans
+
+def parse_segments(tokens, tokenizer):
+    """ 根据时间戳token把解码结果切分为[(起始秒, 结束秒, 文本)] """
+    segments, start, text_tokens = [], None, []
+    for token in tokens:
+        if token >= tokenizer.timestamp_begin:
+            t = (token - tokenizer.timestamp_begin) * TIME_PRECISION
+            if text_tokens:
+                segments.append((start if start is not None else t, t, tokenizer.decode(text_tokens)))
+                text_tokens, start = [], None
+            else:
+                start = t
+        elif token < tokenizer.eot:
+            text_tokens.append(token)
+    if text_tokens:
+        segments.append((start or 0.0, float(WINDOW_SECONDS), tokenizer.decode(text_tokens)))
+    return segments
+
+def split(segments, spans, tolerance=0.1):
+    """ segments[w]是第w个窗口的解码片段，按时间重叠把文本分配回每段音频
+    返回每段音频的文本，以及无法可靠分配、需要单独重新解码的音频编号：
+    - 一个片段与多段音频的重叠都超过tolerance秒（whisper没有在静音间隔处切分，或者没有输出时间戳）
+    - 与其他音频共用窗口的一段音频没有分到任何文本 """
+    texts = [[] for _ in spans]
+    redo = set()
+    for w, window_segments in enumerate(segments):
+        owners = [i for i, span in enumerate(spans) if span[0] == w]
+        for start, end, text in window_segments:
+            def overlap(i):
+                _, s, e = spans[i]
+                return min(end, e) - max(start, s)
+            overlapping = [i for i in owners if overlap(i) > tolerance]
+            if len(overlapping) > 1:
+                redo.update(overlapping)
+                continue
+            def distance(i):
+                _, s, e = spans[i]
+                return -overlap(i) if overlap(i) > 0 else max(s - end, start - e)
+            texts[min(owners, key=distance)].append(text)
+        if len(owners) > 1:
+            redo.update(i for i in owners if not "".join(texts[i]).strip())
+    return ["".join(parts).strip() for parts in texts], sorted(redo)
+
+def pack_groups(audios, groups):
+    """ 按组分别打包，不同组的音频不会出现在同一个窗口中（服务器上按客户端分组，一个客户端的文本不会分配给另一个客户端）
+    返回值与pack相同，spans与audios的顺序一致 """
+    members = {}
+    for i, group in enumerate(groups):
+        members.setdefault(group, []).append(i)
+    windows, spans = [], [None] * len(audios)
+    for indices in members.values():
+        group_windows, group_spans = pack([audios[i] for i in indices])
+        for i, (w, start, end) in zip(indices, group_spans):
+            spans[i] = (len(windows) + w, start, end)
+        windows += group_windows
+    return windows, spans
+
+def transcribe_packed(audios, decode_windows, groups=None):
+    """ 打包解码：decode_windows输入窗口列表，返回每个窗口的片段列表
+    groups不为None时只把同一组的音频打包进同一个窗口，所有窗口仍然一起解码
+    无法从打包结果中分配文本的句子各自占用一个窗口重新解码 """
+    windows, spans = pack(audios) if groups is None else pack_groups(audios, groups)
+    texts, redo = split(decode_windows(windows), spans)
+    if redo:
+        REDECODED.inc(len(redo))
+        segments = decode_windows([pad_or_trim(audios[i]) for i in redo])
+        for i, window_segments in zip(redo, segments):
+            texts[i] = "".join(text for _, _, text in window_segments).strip()
+    return texts
@@ -0,0 +1,265 @@
+import time
+import queue
+import itertools
+import logging
+import threading
+import config
+import metrics
+from agreement import LocalAgreement
+from decoding_context import DecodingContext
+from transcript_writer import TranscriptWriter
+
+log = logging.getLogger(__name__)
+
+DROPPED = metrics.counter("voice_stage_dropped_total", "各阶段因队列已满丢弃的任务数")
+ASR_SECONDS = metrics.histogram("voice_asr_decode_seconds", "每句话的识别耗时")
+TRANSLATE_SECONDS = metrics.histogram("voice_translate_seconds", "每次翻译请求的往返耗时")
+END_TO_END_SECONDS = metrics.histogram("voice_end_to_end_seconds", "从一句话说完到结果交给前端的耗时")
+ORIGINAL_SECONDS = metrics.histogram("voice_original_delivery_seconds", "从一句话说完到原文交给前端的耗时")
+
+class Stage:
+    """ 流水线中的一个阶段：有界队列 + 若干工作线程
+    队列满时的处理策略：
+        block--------等待队列有空位（向上游施加背压）
+        drop_newest--丢弃新到的任务
+        drop_oldest--丢弃队列中最旧的任务 """
+    def __init__(self, name, handler, workers=1, maxsize=16, policy="block", next_stage=None):
+        if policy not in ("block", "drop_newest", "drop_oldest"):
+            raise ValueError(f"未知的队列策略: {policy}")
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.policy = policy
+        self.next_stage = next_stage
+        self.q = queue.Queue(maxsize)
+        self.dropped = 0    # 被丢弃的任务数
+        metrics.gauge("voice_stage_queue_depth", "各阶段队列的长度").set_function(self.q.qsize, stage=name)
+
+    def start(self):
+        for n in range(self.workers):
+            threading.Thread(target=self._run, name=f"{self.name}-{n}", daemon=True).start()
+        return self
+
+    def put(self, item):
+        if self.policy == "block":
+            self.q.put(item)
+            return True
+        while True:
+            try:
+                self.q.put_nowait(item)
+                return True
+            except queue.Full:
+                self.dropped += 1
+                DROPPED.inc(stage=self.name)
+                if self.policy == "drop_newest":
+                    log.warning("%s队列已满，丢弃新任务", self.name)
+                    return False
+            try:
+                self.q.get_nowait()
+                self.q.task_done()
+                log.warning("%s队列已满，丢弃最旧的任务", self.name)
+            except queue.Empty:
+                pass
+
+    def join(self):
+        # 等待队列中的任务全部处理完
+        self.q.join()
+
+    def _run(self):
+        while True:
+            item = self.q.get()
+            try:
+                result = self.handler(item)
+                if result is not None and self.next_stage is not None:
+                    self.next_stage.put(result)
+            except Exception as e:
+                log.exception("%s处理失败: %r", self.name, e)
+            finally:
+                self.q.task_done()
+
+class BatchStage(Stage):
+    """ 批处理阶段：在batch_delay秒内最多合并batch_size个任务，handler输入任务列表，返回结果列表 """
+    def __init__(self, name, handler, workers=1, maxsize=16, policy="block", next_stage=None,
+                 batch_size=8, batch_delay=0.2):
+        super().__init__(name, handler, workers, maxsize, policy, next_stage)
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+
+    def _collect(self):
+        batch = [self.q.get()]
+        deadline = time.monotonic() + self.batch_delay
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.q.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                for result in self.handler(batch):
+                    if result is not None and self.next_stage is not None:
+                        self.next_stage.put(result)
+            except Exception as e:
+                log.exception("%s处理失败: %r", self.name, e)
+            finally:
+                for _ in batch:
+                    self.q.task_done()
+
+class Pipeline:
+    """ 识别流水线：分段后的音频 → 语音识别 → 翻译 → 发送给前端
+    识别完成后先发送原文（translating为True），翻译完成后再发送同一编号的完整结果，前端按编号原地合并
+    writer接收转录记录，默认写入config.FileName """
+    def __init__(self, voiceTotext, f, writer=None):
+        self.voiceTotext = voiceTotext
+        self.f = f
+        self.delivery = Stage("delivery", self.deliver, 1, config.DeliveryQueueSize, "block")
+        # 积压的句子合并为一次批量翻译请求
+        self.translate = BatchStage("translate", self.translate_sentences, config.TranslateWorkers,
+                                    config.TranslateQueueSize, config.TranslatePolicy, self.delivery,
+                                    config.TranslateBatchSize, config.TranslateBatchDelay)
+        self.asr = Stage("asr", self.recognize_sentence, config.AsrWorkers,
+                         config.AsrQueueSize, config.AsrPolicy, self.translate)
+        # 每路音频流只识别最新的快照，排队期间被新快照取代或句子已经结束的快照直接跳过
+        self.partial = Stage("partial", self.recognize_partial, 1, config.PartialQueueSize,
+                             "drop_oldest", self.delivery)
+        self.partial_seq = itertools.count()
+        self.partial_latest = {}    # 音频流 -> 最新快照的序号
+        self.agreements = {}    # (音频流, 句子编号) -> 正在说的句子的稳定前缀
+        self.contexts = {}      # 音频流 -> 解码上下文
+        self.contexts_lock = threading.Lock()
+        self.writer = writer or TranscriptWriter()  # 后台写入转录文件
+        # 会话编号区分每次运行，转录记录和音频归档用(会话, 音频流, 句子编号)对应
+        self.session = time.strftime("%Y%m%d-%H%M%S")
+        self.archive = None
+        if config.ArchiveAudio:
+            from audio_archive import AudioArchive
+            self.archive = AudioArchive()
+
+    def start(self):
+        for stage in (self.delivery, self.translate, self.asr, self.partial):
+            stage.start()
+        return self
+
+    def join(self):
+        # 等待已提交的句子全部发送完
+        for stage in (self.asr, self.translate, self.delivery):
+            stage.join()
+
+    def close(self):
+        # 写出已排队的转录记录和归档音频并关闭文件，不等待流水线中的句子，需要时先调用join
+        self.writer.close()
+        if self.archive is not None:
+            self.archive.close()
+            self.archive = None
+
+    def context(self, stream):
+        with self.contexts_lock:
+            if stream not in self.contexts:
+                self.contexts[stream] = DecodingContext()
+            return self.contexts[stream]
+
+    def submit(self, sentence_id, audio, stream=config.DefaultStream, span=(None, None), ended=None):
+        # 音频在入队时拷贝一次，之后录音缓冲区可以被覆盖
+        # span是这句话在音频流中的起止采样位置，ended是这句话最后一个采样点录入的时间
+        # timings记录各阶段的时间点，用于统计延迟
+        self.agreements.pop((stream, sentence_id), None)
+        timings = {"ended": ended or time.time(), "audio": round(len(audio) / config.RATE, 3)}
+        audio = audio.copy()
+        if self.archive is not None:
+            self.archive.add(self.session, stream, sentence_id, audio, *span)
+        return self.asr.put({"id": sentence_id, "stream": stream, "audio": audio,
+                             "start": span[0], "end": span[1], "timings": timings})
+
+    def submit_text(self, sentence_id, text, stream=config.DefaultStream, span=(None, None)):
+        # 流式连接由服务器完成分句和识别，收到的原文直接进入翻译阶段
+        if not text.strip():
+            return False
+        return self.translate.put(self.send_original(
+            {"id": sentence_id, "stream": stream, "original": text,
+             "start": span[0], "end": span[1], "timings": {"received": time.time()}}))
+
+    def submit_partial(self, sentence_id, audio, stream=config.DefaultStream):
+        # 句子还没说完，提交当前已录到的音频做中间识别
+        self.agreements.setdefault((stream, sentence_id), LocalAgreement())
+        seq = self.partial_latest[stream] = next(self.partial_seq)
+        return self.partial.put({"id": sentence_id, "stream": stream, "audio": audio.copy(), "seq": seq})
+
+    def recognize_partial(self, item):
+        key = (item["stream"], item["id"])
+        agreement = self.agreements.get(key)
+        if agreement is None or self.partial_latest.get(item["stream"]) != item["seq"]:
+            return None
+        context = self.context(item["stream"])
+        tail = self.voiceTotext.transcribe_partial(item["audio"], agreement.prefix, context.language, context.prompt)
+        # 这句话已经结束，不再发送中间结果
+        if self.agreements.get(key) is not agreement:
+            return None
+        committed, unstable = agreement.update(tail)
+        return self.voiceTotext.build_partial_message(item["id"], committed, unstable, item["stream"])
+
+    def recognize_sentence(self, item):
+        timings = item["timings"]
+        timings["asr_start"] = time.time()
+        # 语言还没有锁定时先检测语言，之前几句话作为prompt
+        context = self.context(item["stream"])
+        if context.language is None:
+            context.detected(*self.voiceTotext.detect_language(item["audio"]))
+        # 编号更大的句子可能先识别完，prompt只取这句话之前的句子
+        prompt = context.prompt_before(item["id"])
+        text, cost = self.voiceTotext.transcribe(item["audio"], item["id"], context.language, prompt)
+        context.add(text, item["id"])
+        timings["asr_end"] = time.time()
+        ASR_SECONDS.observe(timings["asr_end"] - timings["asr_start"])
+        log.info("原文: %s", text)
+        log.info("识别耗时: %ss", cost)
+        if not text.strip():
+            return None
+        return self.send_original({"id": item["id"], "stream": item["stream"], "original": text,
+                                   "start": item["start"], "end": item["end"], "timings": timings})
+
+    def send_original(self, item):
+        # 不等待翻译，原文直接交给发送阶段，翻译与下一句话的识别同时进行
+        # timings在翻译阶段还会更新，发送的是拷贝
+        self.delivery.put(self.voiceTotext.build_message(
+            item["id"], item["original"], "", dict(item["timings"]), item["stream"], translating=True))
+        return item
+
+    def translate_sentences(self, items):
+        start = time.time()
+        translated = self.voiceTotext.translate_batch([item["original"] for item in items])
+        end = time.time()
+        TRANSLATE_SECONDS.observe(end - start)
+        messages = []
+        for item, text in zip(items, translated):
+            log.info("第%d句话翻译完成: %s", item["id"], text)
+            item["timings"].update(translate_start=start, translate_end=end)
+            self.writer.write(self.transcript_record(item, text))
+            messages.append(self.voiceTotext.build_message(
+                item["id"], item["original"], text, item["timings"], item["stream"]))
+        return messages
+
+    def transcript_record(self, item, translated):
+        return {
+            "session": self.session,
+            "id": item["id"],
+            "stream": item["stream"],
+            "start": item["start"],
+            "end": item["end"],
+            "original": item["original"],
+            "translated": translated,
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()),
+            "timings": item["timings"],
+        }
+
+    def deliver(self, message):
+        timings = message.get("timings", {})
+        if message.get("final", True) and "ended" in timings:
+            histogram = ORIGINAL_SECONDS if message.get("translating") else END_TO_END_SECONDS
+            histogram.observe(time.time() - timings["ended"])
+        self.f(message)
@@ -0,0 +1,185 @@
+# 回放wav文件驱动完整的识别流程（recording_callback → 队列 → VAD → 识别 → 翻译），不需要录音设备和网络
+# 用法：python replay.py a.wav b.wav --fast --stub-translate --engine ct2-int8
+# 每个wav文件旁边的同名.txt文件作为参考文本（不写入转录文件），用于计算词错误率
+import os
+import re
+import json
+import time
+import wave
+import argparse
+import threading
+import numpy as np
+import config
+
+class WavSource:
+    """ 从wav文件读取音频，按CHUNK大小调用录音回调，模拟录音设备
+    realtime=True时按真实时间回放，否则尽可能快地回放（录音队列满时等待，不丢数据；
+    识别和翻译阶段是否丢弃由config中的队列策略决定，--fast时改为等待） """
+    def __init__(self, paths, realtime=False):
+        self.paths = paths
+        self.realtime = realtime
+
+    def run(self, capture):
+        started = time.time()
+        fed = 0     # 已回放的采样点数
+        for path in self.paths:
+            for data in self.read_chunks(path):
+                if self.realtime:
+                    delay = started + fed / config.RATE - time.time()
+                    if delay > 0:
+                        time.sleep(delay)
+                else:
+                    while capture.q.full():
+                        time.sleep(0.001)
+                frames = len(data) // 2
+                capture.recording_callback(data, frames, None, 0)
+                fed += frames
+            # 文件之间插入静音，保证上一句话结束
+            silence = bytes(2 * (config.Internal + config.RATE))
+            capture.q.put(silence)
+            fed += len(silence) // 2
+        capture.q.put(None)
+        return fed / config.RATE
+
+    @staticmethod
+    def read_chunks(path):
+        with wave.open(path, "rb") as f:
+            if f.getsampwidth() != 2 or f.getframerate() != config.RATE:
+                raise ValueError(f"{path}: 需要{config.RATE}Hz 16bit的wav文件")
+            channels = f.getnchannels()
+            while True:
+                data = f.readframes(config.CHUNK)
+                if not data:
+                    return
+                if channels > 1:
+                    data = np.frombuffer(data, np.int16).reshape(-1, channels)[:, 0].tobytes()
+                yield data
+
+def normalize_words(text):
+    return re.sub(r"[^\w\s']", " ", text.lower()).split()
+
+def word_error_rate(reference, hypothesis):
+    ref, hyp = normalize_words(reference), normalize_words(hypothesis)
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    # 编辑距离，只保留一行
+    row = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        prev, row[0] = row[0], i
+        for j, h in enumerate(hyp, 1):
+            prev, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, prev + (r != h))
+    return row[-1] / len(ref)
+
+def percentiles(values):
+    if not values:
+        return {}
+    return {f"p{p}": round(float(np.percentile(values, p)), 3) for p in (50, 90, 99)}
+
+def report(messages, audio_seconds, wall_seconds, references):
+    stages = {
+        "asr_wait": ("ended", "asr_start"),
+        "asr_decode": ("asr_start", "asr_end"),
+        "translate_wait": ("asr_end", "translate_start"),
+        "translate": ("translate_start", "translate_end"),
+        "delivery": ("translate_end", "delivered"),
+        "original_to_ui": ("ended", "original_delivered"),
+        "end_to_ui": ("ended", "delivered"),
+    }
+    latencies = {name: [] for name in stages}
+    for message in messages:
+        t = message["timings"]
+        for name, (a, b) in stages.items():
+            if a in t and b in t:
+                latencies[name].append(t[b] - t[a])
+    decode = sum(latencies["asr_decode"])
+    result = {
+        "sentences": len(messages),
+        "audio_seconds": round(audio_seconds, 2),
+        "wall_seconds": round(wall_seconds, 2),
+        "rtf_decode": round(decode / audio_seconds, 3) if audio_seconds else None,
+        "rtf_wall": round(wall_seconds / audio_seconds, 3) if audio_seconds else None,
+        "latency": {name: percentiles(values) for name, values in latencies.items()},
+    }
+    if references:
+        hypothesis = " ".join(m["original"] for m in sorted(messages, key=lambda m: m["id"]))
+        result["wer"] = round(word_error_rate(" ".join(references), hypothesis), 4)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="回放wav文件，统计各阶段延迟、实时率和词错误率")
+    parser.add_argument("wavs", nargs="+")
+    parser.add_argument("--fast", action="store_true", help="尽可能快地回放，默认按真实时间回放")
+    parser.add_argument("--stub-translate", action="store_true", help="使用本地模拟翻译")
+    parser.add_argument("--engine", help="识别引擎，默认使用config.AsrEngine")
+    parser.add_argument("--model", help="识别模型，默认使用config.VoiceToWordModel")
+    parser.add_argument("--vad-threshold", type=float)
+    parser.add_argument("--hangover", type=int, help="静音多少个采样点认为一句话结束")
+    parser.add_argument("--json", help="把结果写入json文件")
+    args = parser.parse_args()
+
+    # 在导入识别流程之前修改配置
+    config.FileName = None
+    if args.stub_translate:
+        config.TranslateProviders = ["stub"]
+    if args.engine:
+        config.AsrEngine = args.engine
+    if args.model:
+        config.VoiceToWordModel = args.model
+    if args.vad_threshold is not None:
+        config.VadThreshold = args.vad_threshold
+    if args.hangover is not None:
+        config.Internal = args.hangover
+    if args.fast:
+        # 回放速度超过识别速度时等待而不是丢弃句子，否则词错误率和实时率没有意义；不做中间识别
+        config.AsrPolicy = "block"
+        config.TranslatePolicy = "block"
+        config.PartialInterval = 0
+
+    import audio_capture
+
+    messages = []
+    originals = {}      # (音频流, 句子编号) -> 原文发送的时间
+    lock = threading.Lock()
+
+    def deliver(message):
+        if not message.get("final", True):
+            return
+        key = (message["stream"], message["id"])
+        if message.get("translating"):
+            originals[key] = time.time()
+            return
+        message["timings"]["delivered"] = time.time()
+        if key in originals:
+            message["timings"]["original_delivered"] = originals.pop(key)
+        with lock:
+            messages.append(message)
+
+    capture = audio_capture.AudioCapture(True, deliver)
+    worker = threading.Thread(target=capture.run, daemon=True)
+    worker.start()
+
+    start = time.time()
+    audio_seconds = WavSource(args.wavs, realtime=not args.fast).run(capture)
+    worker.join()
+    capture.pipeline.join()
+    capture.pipeline.close()
+    wall = time.time() - start
+
+    references = []
+    for path in args.wavs:
+        ref = os.path.splitext(path)[0] + ".txt"
+        if os.path.exists(ref):
+            with open(ref, encoding="utf-8") as f:
+                references.append(f.read())
+
+    result = report(messages, audio_seconds, wall, references)
+    result["dropped_chunks"] = capture.dropped
+    result["dropped_sentences"] = capture.pipeline.asr.dropped
+    result["dropped_translations"] = capture.pipeline.translate.dropped
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+import numpy as np
+
+class RingBuffer:
+    """ 预分配的float32环形缓冲区，按绝对采样位置读写，长时间录音内存保持不变 """
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.buf = np.zeros(capacity, np.float32)
+        self.end = 0    # 已写入的总采样数（绝对位置）
+
+    @property
+    def start(self):
+        # 缓冲区中仍然有效的最早采样位置
+        return max(0, self.end - self.capacity)
+
+    def write_pcm16(self, data: bytes):
+        # int16字节数据直接归一化写入缓冲区，不产生中间数组
+        pcm = np.frombuffer(data, np.int16)
+        if len(pcm) > self.capacity:
+            self.end += len(pcm) - self.capacity
+            pcm = pcm[-self.capacity:]
+        n = len(pcm)
+        pos = self.end % self.capacity
+        first = min(n, self.capacity - pos)
+        np.multiply(pcm[:first], np.float32(1 / 32768.0), out=self.buf[pos:pos + first], casting="unsafe")
+        if first < n:
+            np.multiply(pcm[first:], np.float32(1 / 32768.0), out=self.buf[:n - first], casting="unsafe")
+        self.end += n
+        return n
+
+    def read(self, start: int, end: int):
+        # 返回[start, end)区间的数据，不跨越缓冲区边界时是视图，跨越时拷贝一次
+        if start < self.start or end > self.end or start > end:
+            raise IndexError(f"区间[{start}, {end})不在缓冲区[{self.start}, {self.end})内")
+        s, e = start % self.capacity, end % self.capacity
+        if end - start == 0:
+            return self.buf[0:0]
+        if s < e or e == 0:
+            return self.buf[s:e or self.capacity]
+        return np.concatenate((self.buf[s:], self.buf[:e]))
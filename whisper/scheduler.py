@@ -0,0 +1,160 @@
+import math
+import time
+import threading
+from collections import deque, OrderedDict
+from concurrent.futures import Future
+import config
+import metrics
+
+REJECTED = metrics.counter("voice_scheduler_rejected_total", "调度器因过载拒绝的请求数")
+WAIT_SECONDS = metrics.histogram("voice_scheduler_wait_seconds", "请求在调度队列中的等待时间")
+
+class Overloaded(Exception):
+    """ 服务器过载，retry_after是建议客户端重试前等待的秒数 """
+    def __init__(self, reason, retry_after=1):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+class Job:
+    def __init__(self, session, audio, options, cost):
+        self.session = session
+        self.audio = audio
+        self.options = options
+        self.cost = cost        # 音频时长（秒）
+        self.future = Future()
+        self.enqueued = time.monotonic()
+
+class SessionState:
+    """ 一个客户端的排队状态：tags是排队请求的虚拟开始时间（按入队顺序），
+    subs是客户端内各子会话的请求队列，客户端的份额在子会话之间轮流使用 """
+    def __init__(self, weight):
+        self.weight = weight
+        self.tags = deque()
+        self.subs = OrderedDict()   # 子会话 -> 请求队列
+        self.inflight = 0
+        self.finish = 0.0       # 上一个请求的虚拟结束时间
+
+class FairScheduler:
+    """ 多会话公平调度：每个客户端有独立的队列，按音频时长加权公平地把请求交给batcher
+    公平性按客户端（连接的对端地址）计算，客户端提供的会话编号只作为子会话，在该客户端自己的份额内轮流，
+    客户端每次换一个会话编号也不能多占份额或绕过排队数和并发数的上限
+    使用开始时间公平排队（SFQ）：每个请求的虚拟开始时间 = max(系统虚拟时间, 本会话上一个请求的虚拟结束时间)
+    虚拟结束时间 = 开始时间 + 音频时长 / 权重，总是先分发开始时间最小的请求，持续发送长句的会话不会饿死其他会话
+    准入控制：排队总数或单个会话的排队数超过上限时直接拒绝（Overloaded），排队超过max_wait秒的请求不再解码 """
+    def __init__(self, submit, max_inflight=None, max_pending=None, session_queue=None,
+                 session_inflight=None, max_wait=None, weights=None):
+        self.submit_batch = submit      # batcher.submit，返回Future
+        self.max_inflight = max_inflight or config.SchedulerInflight
+        self.max_pending = max_pending or config.SchedulerMaxPending
+        self.session_queue = session_queue or config.SessionQueueSize
+        self.session_inflight = session_inflight or config.SessionInflight
+        self.max_wait = max_wait or config.SchedulerMaxWait
+        self.weights = weights if weights is not None else config.SessionWeights
+        self.sessions = {}      # 会话 -> SessionState
+        self.vtime = 0.0        # 系统虚拟时间
+        self.pending = 0
+        self.pending_cost = 0.0
+        self.inflight = 0
+        self.rtf = 0.1          # 解码耗时/音频时长的滑动平均，用于估计重试等待时间
+        self.cond = threading.Condition()
+        metrics.gauge("voice_scheduler_pending", "调度队列中等待的请求数").set_function(lambda: self.pending)
+        metrics.gauge("voice_scheduler_sessions", "有请求排队或正在解码的会话数").set_function(lambda: len(self.sessions))
+        threading.Thread(target=self._run, name="fair-scheduler", daemon=True).start()
+
+    def retry_after(self):
+        # 按积压的音频时长和解码速度估计排空队列需要的时间
+        return max(1, math.ceil(self.pending_cost * self.rtf / self.max_inflight))
+
+    def overloaded(self):
+        return self.pending >= self.max_pending
+
+    def submit(self, session, audio, sub=None, admit=True, **options) -> Future:
+        # session是客户端，sub是客户端内的子会话；admit为False时跳过准入检查，用于已经建立的流式连接
+        with self.cond:
+            state = self.sessions.get(session)
+            if admit:
+                if self.pending >= self.max_pending:
+                    REJECTED.inc(reason="server")
+                    raise Overloaded("服务器繁忙", self.retry_after())
+                if state is not None and len(state.tags) >= self.session_queue:
+                    REJECTED.inc(reason="session")
+                    raise Overloaded("本会话的请求过多", self.retry_after())
+            if state is None:
+                state = self.sessions[session] = SessionState(self.weights.get(session, 1))
+            cost = len(audio) / config.RATE
+            tag = max(self.vtime, state.finish)
+            state.finish = tag + cost / state.weight
+            job = Job(session, audio, options, cost)
+            state.tags.append(tag)
+            state.subs.setdefault(sub, deque()).append(job)
+            self.pending += 1
+            self.pending_cost += cost
+            self.cond.notify()
+        return job.future
+
+    def _pick(self):
+        # 在没有达到并发上限的客户端中选择虚拟开始时间最小的，再在它的子会话之间轮流取请求
+        best = None
+        for state in self.sessions.values():
+            if state.tags and state.inflight < self.session_inflight:
+                if best is None or state.tags[0] < best.tags[0]:
+                    best = state
+        if best is None:
+            return None
+        tag = best.tags.popleft()
+        sub, jobs = next(iter(best.subs.items()))
+        job = jobs.popleft()
+        if jobs:
+            best.subs.move_to_end(sub)
+        else:
+            del best.subs[sub]
+        best.inflight += 1
+        self.pending -= 1
+        self.pending_cost -= job.cost
+        self.vtime = max(self.vtime, tag)
+        return job
+
+    def _run(self):
+        while True:
+            with self.cond:
+                job = None
+                while job is None:
+                    if self.inflight < self.max_inflight:
+                        job = self._pick()
+                    if job is None:
+                        self.cond.wait()
+                self.inflight += 1
+            waited = time.monotonic() - job.enqueued
+            WAIT_SECONDS.observe(waited)
+            if waited > self.max_wait:
+                REJECTED.inc(reason="timeout")
+                self._done(job, 0)
+                job.future.set_exception(Overloaded("排队超时", self.retry_after()))
+                continue
+            try:
+                future = self.submit_batch(job.audio, group=job.session, **job.options)
+            except Exception as e:
+                self._done(job, 0)
+                job.future.set_exception(e)
+                continue
+            future.add_done_callback(lambda future, job=job, start=time.monotonic(): self._finish(job, future, start))
+
+    def _finish(self, job, future, start):
+        self._done(job, time.monotonic() - start)
+        if future.exception() is not None:
+            job.future.set_exception(future.exception())
+        else:
+            job.future.set_result(future.result())
+
+    def _done(self, job, seconds):
+        with self.cond:
+            self.inflight -= 1
+            state = self.sessions[job.session]
+            state.inflight -= 1
+            if seconds and job.cost:
+                self.rtf = 0.9 * self.rtf + 0.1 * seconds / job.cost
+            # 空闲的会话不再保留状态
+            if not state.tags and state.inflight == 0:
+                del self.sessions[job.session]
+            self.cond.notify()
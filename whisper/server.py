@@ -1,43 +1,167 @@
 # server.py
 import time
-import torch
+import asyncio
+import logging
+import threading
+import queue
+import urllib.parse
 import numpy as np
-import whisper
 import config
-from fastapi import FastAPI
-# from pydantic import BaseModel
+import metrics
+import audio_codec
+from scheduler import Overloaded
+from fastapi import FastAPI, Request, WebSocket
+from fastapi.responses import JSONResponse, Response
 import uvicorn
 
+logging.basicConfig(level=config.LogLevel, format=config.LogFormat)
+log = logging.getLogger(__name__)
+
+REQUEST_SECONDS = metrics.histogram("voice_server_request_seconds", "每个识别请求的处理耗时")
+
 app = FastAPI()
 
 # ===== 全局只加载一次 =====
-device = "cuda" if torch.cuda.is_available() else "cpu"
-print(device)
-model = whisper.load_model(config.VoiceToWordModel).to(device)
+# 识别引擎在config.AsrEngine中选择，并发请求合并为批次解码
+# 在startup中启动后台线程加载，多进程识别时子进程导入本文件不会重复加载
+backend = None
+batcher = None
+scheduler = None
+ready = threading.Event()
+
+def load_backend():
+    global backend, batcher, scheduler
+    import asr_backend
+    from batcher import DecodeBatcher
+    from scheduler import FairScheduler
+    backend = asr_backend.create_backend()
+    if config.WarmUp:
+        backend.warmup()
+    batcher = DecodeBatcher(backend.transcribe_batch, workers=backend.concurrency)
+    # 各客户端的请求先进入公平调度器，再交给batcher合并解码
+    scheduler = FairScheduler(batcher.submit)
+    ready.set()
+    log.info("识别引擎已就绪")
 
-options = whisper.DecodingOptions(
-    task="transcribe",
-    language=None,
-    fp16=torch.cuda.is_available()
-)
+@app.on_event("startup")
+def on_startup():
+    threading.Thread(target=load_backend, daemon=True).start()
 
-# class AudioRequest(BaseModel):
-#     audio: list[float]   # 16kHz mono PCM
+@app.get("/ready")
+def get_ready():
+    return JSONResponse({"ready": ready.is_set()}, status_code=200 if ready.is_set() else 503)
+
+def busy_response(e):
+    return JSONResponse({"error": e.reason}, status_code=429, headers={"Retry-After": str(e.retry_after)})
 
 @app.post("/translate")
-def translate_audio(req):#: AudioRequest):
+async def translate_audio(request: Request):
     start_time = time.time()
+    if not ready.is_set():
+        return JSONResponse({"error": "模型加载中"}, status_code=503, headers={"Retry-After": "1"})
+    body = await request.body()
 
-    audio = np.array(req.audio, dtype=np.float32)
-
-    # === 30s 窗口 ===
-    audio = whisper.pad_or_trim(audio)
-    mel = whisper.log_mel_spectrogram(audio).to(device)
+    # 默认是二进制PCM数据，兼容旧的JSON格式；格式错误或采样率不是config.RATE时返回400
+    try:
+        if request.headers.get("content-type", "").startswith("application/json"):
+            info, audio = {"id": 0}, np.array((await request.json())["audio"], dtype=np.float32)
+        else:
+            info, audio = audio_codec.decode(body)
+            if info["sample_rate"] != config.RATE:
+                raise ValueError(f"采样率必须是{config.RATE}Hz，收到{info['sample_rate']}Hz")
+    except (ValueError, KeyError, TypeError) as e:
+        return JSONResponse({"error": f"无效的音频数据: {e}"}, status_code=400)
 
-    result = whisper.decode(model, mel, options)
+    # 客户端的解码上下文：锁定的语言和之前几句话
+    language = request.headers.get("x-language") or None
+    prompt = urllib.parse.unquote(request.headers.get("x-prompt", "")) or None
+    # 按客户端地址公平调度，X-Session只区分同一客户端内的会话；过载时返回429，客户端在Retry-After秒后重试
+    try:
+        text = await asyncio.wrap_future(scheduler.submit(
+            request.client.host, audio, sub=request.headers.get("x-session"), language=language, prompt=prompt))
+    except Overloaded as e:
+        return busy_response(e)
+    REQUEST_SECONDS.observe(time.time() - start_time)
     return {
-        "origin": result.text,
+        "id": info["id"],
+        "origin": text,
         "cost": round(time.time() - start_time, 3)
     }
 
-uvicorn.run(app, host="0.0.0.0", port=8000)
+@app.websocket("/stream")
+async def stream_audio(ws: WebSocket):
+    # 流式识别：客户端在一个长连接上连续发送16kHz单声道int16 PCM，服务器端VAD分句识别后把结果发回同一个连接
+    # 查询参数stream是音频流编号，language指定语言；客户端发送文本"end"表示音频结束
+    await ws.accept()
+    # 模型加载中或服务器过载时拒绝新连接，客户端稍后重试
+    if not ready.is_set() or scheduler.overloaded():
+        await ws.close(code=1013)
+        return
+    from audio_capture import AudioCapture
+    from stream_session import StreamSession
+
+    loop = asyncio.get_running_loop()
+    outbox = asyncio.Queue()
+    stream_id = ws.query_params.get("stream") or config.DefaultStream
+    session = StreamSession(backend, scheduler, ws.client.host, (ws.query_params.get("session"), stream_id),
+                            lambda message: loop.call_soon_threadsafe(outbox.put_nowait, message),
+                            stream_id, ws.query_params.get("language") or None)
+    capture = await asyncio.to_thread(AudioCapture, False, None, stream_id, session, False)
+    reader = threading.Thread(target=capture.run, name=f"stream-vad-{stream_id}", daemon=True)
+    reader.start()
+    sender = asyncio.create_task(send_messages(ws, outbox))
+    log.info("[%s] 流式连接已建立", stream_id)
+    leftover = b""      # 帧的字节数为奇数时，最后一个字节留到下一帧
+    try:
+        while True:
+            message = await ws.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes"):
+                data = leftover + message["bytes"]
+                cut = len(data) - len(data) % 2
+                data, leftover = data[:cut], data[cut:]
+                if data and not await put_chunk(capture, reader, data):
+                    log.error("[%s] 分句线程已退出，关闭连接", stream_id)
+                    break
+            elif message.get("text") == "end":
+                break
+    finally:
+        # 处理完最后一句话，发完剩余的结果后关闭连接
+        if await put_chunk(capture, reader, None):
+            await asyncio.to_thread(reader.join)
+        await asyncio.to_thread(session.close)
+        outbox.put_nowait(None)
+        await sender
+        try:
+            await ws.close()
+        except Exception:
+            pass
+        log.info("[%s] 流式连接已关闭", stream_id)
+
+async def put_chunk(capture, reader, chunk):
+    # 分句线程处理不过来时不再读取，通过TCP向客户端施加背压；分句线程已经退出时返回False
+    while reader.is_alive():
+        try:
+            capture.q.put_nowait(chunk)
+            return True
+        except queue.Full:
+            await asyncio.sleep(0.02)
+    return False
+
+async def send_messages(ws, outbox):
+    while True:
+        message = await outbox.get()
+        if message is None:
+            return
+        try:
+            await ws.send_json(message)
+        except Exception as e:
+            log.warning("流式结果发送失败: %r", e)
+
+@app.get("/metrics")
+def get_metrics():
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="0.0.0.0", port=8000)
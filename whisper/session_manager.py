@@ -0,0 +1,71 @@
+import logging
+import threading
+import numpy as np
+import config
+import voice_to_text
+from pipeline import Pipeline
+from audio_capture import AudioCapture, PA_CONTINUE
+
+log = logging.getLogger(__name__)
+
+class SessionManager:
+    """ 多路音频同时识别
+    每路音频流有独立的缓冲区、VAD和分句状态，所有音频流共享同一个识别流水线和模型
+    远程模式下开启config.StreamToServer时，录音直接发送到服务器，由服务器分句和识别
+    inputs的格式见config.Streams """
+    def __init__(self, is_local: bool, f, inputs=None):
+        self.inputs = inputs or config.Streams
+        self.voiceTotext = voice_to_text.VoiceToText(is_local)
+        self.pipeline = Pipeline(self.voiceTotext, f).start()
+        self.captures = {}      # 音频流编号 -> AudioCapture
+        for entry in self.inputs:
+            for stream_id in entry["streams"]:
+                if stream_id in self.captures:
+                    raise ValueError(f"音频流编号重复: {stream_id}")
+                if not is_local and config.StreamToServer:
+                    from stream_client import StreamClient
+                    self.captures[stream_id] = StreamClient(stream_id, self.pipeline)
+                else:
+                    self.captures[stream_id] = AudioCapture(is_local, f, stream_id, self.pipeline)
+        self.p = None
+        self.streams = []
+
+    def make_callback(self, captures, channels):
+        # 多声道设备按声道拆分后分别交给对应的音频流
+        def callback(in_data, frame_count, time_info, status):
+            if channels == 1:
+                captures[0].recording_callback(in_data, frame_count, time_info, status)
+            else:
+                pcm = np.frombuffer(in_data, np.int16).reshape(-1, channels)
+                for channel, capture in enumerate(captures):
+                    capture.recording_callback(pcm[:, channel].tobytes(), frame_count, time_info, status)
+            return (None, PA_CONTINUE)
+        return callback
+
+    def start(self):
+        import pyaudio
+        self.p = pyaudio.PyAudio()
+        for entry in self.inputs:
+            channels = entry.get("channels", 1)
+            captures = [self.captures[stream_id] for stream_id in entry["streams"]]
+            if len(captures) > channels:
+                raise ValueError(f"设备{entry['device']}只有{channels}个声道")
+            stream = self.p.open(
+                format=config.FORMAT,
+                channels=channels,
+                rate=config.RATE,
+                input=True,
+                input_device_index=entry["device"],
+                frames_per_buffer=config.CHUNK,
+                stream_callback=self.make_callback(captures, channels)
+            )
+            stream.start_stream()
+            self.streams.append(stream)
+            log.info("已打开设备%s，音频流: %s", entry["device"], ", ".join(entry["streams"]))
+
+        threads = [threading.Thread(target=capture.run, name=f"capture-{stream_id}", daemon=True)
+                   for stream_id, capture in self.captures.items()]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
@@ -0,0 +1,86 @@
+import json
+import time
+import queue
+import logging
+import threading
+import urllib.parse
+import config
+import metrics
+try:
+    import pyaudio
+    PA_CONTINUE = pyaudio.paContinue
+except ImportError:
+    PA_CONTINUE = 0
+
+log = logging.getLogger(__name__)
+
+DROPPED_CHUNKS = metrics.counter("voice_stream_dropped_chunks_total", "流式上传队列已满丢弃的录音块数")
+RECONNECTS = metrics.counter("voice_stream_reconnects_total", "流式连接断开后重连的次数")
+
+class StreamClient:
+    """ 轻量客户端：把一路录音通过WebSocket连续发送到服务器的/stream接口，分句和识别都在服务器上完成
+    本地不需要torch和VAD，服务器返回的原文交给流水线翻译后发送给前端
+    接口与AudioCapture相同（recording_callback、run），由SessionManager统一管理 """
+    def __init__(self, stream_id, pipeline, url=None):
+        self.url = url or config.STREAM_SERVER
+        self.stream_id = stream_id
+        self.pipeline = pipeline
+        self.q = queue.Queue(config.CaptureQueueSize)
+        self.dropped = 0        # 因队列已满丢弃的录音块数
+        self.offset = 0         # 重连后服务器的句子编号从1开始，加上偏移保持编号递增
+        self.last_id = 0
+        metrics.gauge("voice_capture_queue_depth", "录音块队列的长度").set_function(self.q.qsize, stream=stream_id)
+
+    def recording_callback(self, in_data, frame_count, time_info, status):
+        # 录音回调不能阻塞，队列满时丢弃录音块
+        try:
+            self.q.put_nowait(in_data)
+        except queue.Full:
+            self.dropped += 1
+            DROPPED_CHUNKS.inc(stream=self.stream_id)
+        return (None, PA_CONTINUE)
+
+    def run(self):
+        # 发送队列中的录音数据，收到None时结束；连接断开后自动重连
+        while True:
+            try:
+                self.stream()
+                return
+            except Exception as e:
+                RECONNECTS.inc(stream=self.stream_id)
+                log.warning("[%s] 流式连接断开: %r，%ss后重连", self.stream_id, e, config.StreamReconnectDelay)
+                time.sleep(config.StreamReconnectDelay)
+
+    def stream(self):
+        from websockets.sync.client import connect
+        query = urllib.parse.urlencode({"stream": self.stream_id, "language": config.AsrLanguage or ""})
+        with connect(f"{self.url}?{query}", open_timeout=config.ServerTimeout) as ws:
+            log.info("[%s] 已连接流式识别服务器", self.stream_id)
+            self.offset = self.last_id
+            receiver = threading.Thread(target=self.receive, args=(ws,), name=f"stream-recv-{self.stream_id}", daemon=True)
+            receiver.start()
+            while True:
+                chunk = self.q.get()
+                if chunk is None:
+                    # 通知服务器音频结束，服务器发完剩余的结果后关闭连接
+                    ws.send("end")
+                    receiver.join()
+                    return
+                ws.send(chunk)
+
+    def receive(self, ws):
+        from websockets.exceptions import ConnectionClosed
+        try:
+            for raw in ws:
+                message = json.loads(raw)
+                if message.get("type") == "dropped":
+                    log.warning("[%s] 服务器积压过多，丢弃了一句话", self.stream_id)
+                if message.get("type") != "transcript":
+                    continue
+                sentence_id = self.offset + message["id"]
+                self.last_id = max(self.last_id, sentence_id)
+                log.info("[%s] 第%d句话识别完成，服务器耗时%ss", self.stream_id, sentence_id, message["cost"])
+                self.pipeline.submit_text(sentence_id, message["origin"], self.stream_id,
+                                          (message["start"], message["end"]))
+        except ConnectionClosed:
+            pass
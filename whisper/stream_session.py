@@ -0,0 +1,85 @@
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import config
+import metrics
+from decoding_context import DecodingContext
+
+log = logging.getLogger(__name__)
+
+sessions = set()    # 当前的流式识别连接
+metrics.gauge("voice_stream_sessions", "当前的流式识别连接数").set_function(lambda: len(sessions))
+
+STREAM_SECONDS = metrics.histogram("voice_stream_decode_seconds", "流式识别中从一句话说完到结果发出的耗时")
+STREAM_DROPPED = metrics.counter("voice_stream_dropped_sentences_total", "流式连接积压过多丢弃的句子数")
+
+class StreamSession:
+    """ 服务器端的一路流式音频：客户端通过WebSocket连续发送PCM，服务器端VAD分句后识别，结果发回同一个连接
+    作为AudioCapture的识别流水线使用，每路音频流有独立的解码上下文
+    每路音频流的句子按顺序识别（保证prompt连贯），经过公平调度器后与其他连接的句子合并为批次
+    连接建立时已经通过准入检查，之后的句子不受调度器排队数上限的限制，
+    但每个连接最多积压StreamBacklog句，超过时丢弃新的句子并通知客户端 """
+    def __init__(self, backend, scheduler, client, sub, send, stream_id=config.DefaultStream, language=None):
+        self.backend = backend
+        self.scheduler = scheduler
+        self.client = client    # 调度器按客户端地址分配份额，同一客户端的多路音频流共享
+        self.sub = sub          # 客户端内的子会话
+        self.send = send        # 线程安全的发送函数
+        self.stream_id = stream_id
+        self.context = DecodingContext(language)
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix="stream-session")
+        self.backlog = 0        # 已分句、还没有识别完的句子数
+        self.lock = threading.Lock()
+        sessions.add(self)
+
+    def submit(self, sentence_id, audio, stream=config.DefaultStream, span=(None, None), ended=None):
+        with self.lock:
+            if self.backlog >= config.StreamBacklog:
+                STREAM_DROPPED.inc()
+                log.warning("[%s] 积压%d句，丢弃第%d句话", self.stream_id, self.backlog, sentence_id)
+                self.send({"type": "dropped", "id": sentence_id, "stream": self.stream_id})
+                return False
+            self.backlog += 1
+        self.executor.submit(self.recognize, sentence_id, audio.copy(), span, ended or time.time())
+        return True
+
+    def submit_partial(self, sentence_id, audio, stream=config.DefaultStream):
+        # 流式连接只发送整句的结果
+        return False
+
+    def recognize(self, sentence_id, audio, span, ended):
+        try:
+            self.decode(sentence_id, audio, span, ended)
+        finally:
+            with self.lock:
+                self.backlog -= 1
+
+    def decode(self, sentence_id, audio, span, ended):
+        try:
+            if self.context.language is None:
+                self.context.detected(*self.backend.detect_language(audio))
+            text = self.scheduler.submit(self.client, audio, sub=self.sub, admit=False,
+                                         language=self.context.language, prompt=self.context.prompt).result()
+        except Exception as e:
+            log.exception("[%s] 第%d句话识别失败: %r", self.stream_id, sentence_id, e)
+            return
+        self.context.add(text)
+        STREAM_SECONDS.observe(time.time() - ended)
+        if not text.strip():
+            return
+        self.send({
+            "type": "transcript",
+            "id": sentence_id,
+            "stream": self.stream_id,
+            "origin": text,
+            "language": self.context.language,
+            "start": span[0],
+            "end": span[1],
+            "cost": round(time.time() - ended, 3),
+        })
+
+    def close(self):
+        # 等待已分句的音频识别完并发出结果
+        self.executor.shutdown(wait=True)
+        sessions.discard(self)
@@ -2,10 +2,12 @@
 import os
 import json
 import time
+import queue
 import hashlib
 import hmac
+import threading
 from datetime import datetime
-from http.client import HTTPSConnection
+from http.client import HTTPConnection, HTTPSConnection, RemoteDisconnected
 from dotenv import load_dotenv
 
 
@@ -14,113 +16,241 @@ def _sign(key: bytes, msg: str) -> bytes:
     return hmac.new(key, msg.encode("utf-8"), hashlib.sha256).digest()
 
 
-# ---------- 核心请求函数 ----------
-def tc3_request(
-    *,
-    service: str,
-    action: str,
-    payload: dict,
-    region: str = "",
-    version: str = "2018-03-21",
-    host: str = None,
-    timeout: int = 10,
-):
+# ---------- 客户端 ----------
+class TC3Client:
     """
-    通用腾讯云 TC3 API 请求封装
+    腾讯云 TC3 API 客户端
+    - 凭证只在创建时加载一次
+    - 派生的签名密钥按 UTC 日期和服务缓存
+    - 每个地址维护一个 keep-alive 连接池，避免每次请求都重新握手
+    endpoint/https/ssl_context 可以把请求指向本地的测试服务，签名使用的 host 不变
     """
 
-    load_dotenv()
+    def __init__(self, secret_id=None, secret_key=None, *, endpoint=None, https=True,
+                 ssl_context=None, pool_size=4, timeout=10):
+        if secret_id is None or secret_key is None:
+            load_dotenv()
+            secret_id = os.getenv("TENCENTCLOUD_SECRET_ID")
+            secret_key = os.getenv("TENCENTCLOUD_SECRET_KEY")
 
-    secret_id = os.getenv("TENCENTCLOUD_SECRET_ID")
-    secret_key = os.getenv("TENCENTCLOUD_SECRET_KEY")
+        if not secret_id or not secret_key:
+            raise RuntimeError("Missing TENCENTCLOUD_SECRET_ID / SECRET_KEY")
 
-    if not secret_id or not secret_key:
-        raise RuntimeError("Missing TENCENTCLOUD_SECRET_ID / SECRET_KEY")
+        self.secret_id = secret_id
+        self.secret_key = secret_key
+        self.endpoint = endpoint
+        self.https = https
+        self.ssl_context = ssl_context
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._pools = {}            # 地址 -> 空闲连接
+        self._keys = {}             # (日期, 服务) -> 签名密钥
+        self._lock = threading.Lock()
 
-    if not host:
-        host = f"{service}.tencentcloudapi.com"
+    # ===== 签名密钥缓存 =====
+    def _signing_key(self, date: str, service: str) -> bytes:
+        key = self._keys.get((date, service))
+        if key is None:
+            secret_date = _sign(("TC3" + self.secret_key).encode("utf-8"), date)
+            secret_service = _sign(secret_date, service)
+            key = _sign(secret_service, "tc3_request")
+            with self._lock:
+                # 日期变化后旧的密钥不再使用
+                self._keys = {k: v for k, v in self._keys.items() if k[0] == date}
+                self._keys[(date, service)] = key
+        return key
 
-    endpoint = host
-    algorithm = "TC3-HMAC-SHA256"
-    timestamp = int(time.time())
-    date = datetime.utcfromtimestamp(timestamp).strftime("%Y-%m-%d")
+    # ===== 连接池 =====
+    def _pool(self, address):
+        with self._lock:
+            if address not in self._pools:
+                self._pools[address] = queue.LifoQueue(self.pool_size)
+            return self._pools[address]
 
-    payload_json = json.dumps(payload, separators=(",", ":"), ensure_ascii=False)
+    def _connect(self, address, timeout):
+        if self.https:
+            return HTTPSConnection(address, timeout=timeout, context=self.ssl_context)
+        return HTTPConnection(address, timeout=timeout)
 
-    # ===== Step 1: Canonical Request =====
-    http_request_method = "POST"
-    canonical_uri = "/"
-    canonical_querystring = ""
-    content_type = "application/json; charset=utf-8"
+    def _acquire(self, address, timeout):
+        try:
+            conn = self._pool(address).get_nowait()
+        except queue.Empty:
+            return self._connect(address, timeout), False
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn, True
 
-    canonical_headers = (
-        f"content-type:{content_type}\n"
-        f"host:{host}\n"
-        f"x-tc-action:{action.lower()}\n"
-    )
+    def _release(self, address, conn):
+        try:
+            self._pool(address).put_nowait(conn)
+        except queue.Full:
+            conn.close()
 
-    signed_headers = "content-type;host;x-tc-action"
-    hashed_payload = hashlib.sha256(payload_json.encode("utf-8")).hexdigest()
+    def close(self):
+        with self._lock:
+            pools, self._pools = self._pools, {}
+        for pool in pools.values():
+            while not pool.empty():
+                pool.get_nowait().close()
 
-    canonical_request = (
-        http_request_method + "\n" +
-        canonical_uri + "\n" +
-        canonical_querystring + "\n" +
-        canonical_headers + "\n" +
-        signed_headers + "\n" +
-        hashed_payload
-    )
+    def _send(self, address, body, headers, timeout):
+        conn, reused = self._acquire(address, timeout)
+        try:
+            conn.request("POST", "/", body=body, headers=headers)
+            resp = conn.getresponse()
+            data = resp.read().decode("utf-8")
+        except (RemoteDisconnected, ConnectionError):
+            conn.close()
+            if not reused:
+                raise
+            # 复用的连接可能已被服务端关闭，换新连接重试一次
+            conn = self._connect(address, timeout)
+            try:
+                conn.request("POST", "/", body=body, headers=headers)
+                resp = conn.getresponse()
+                data = resp.read().decode("utf-8")
+            except Exception:
+                conn.close()
+                raise
+        except Exception:
+            conn.close()
+            raise
 
-    # ===== Step 2: String To Sign =====
-    credential_scope = f"{date}/{service}/tc3_request"
-    hashed_canonical_request = hashlib.sha256(
-        canonical_request.encode("utf-8")
-    ).hexdigest()
-
-    string_to_sign = (
-        f"{algorithm}\n"
-        f"{timestamp}\n"
-        f"{credential_scope}\n"
-        f"{hashed_canonical_request}"
-    )
+        if resp.will_close:
+            conn.close()
+        else:
+            self._release(address, conn)
+        return resp.status, data
 
-    # ===== Step 3: Signature =====
-    secret_date = _sign(("TC3" + secret_key).encode("utf-8"), date)
-    secret_service = _sign(secret_date, service)
-    secret_signing = _sign(secret_service, "tc3_request")
-
-    signature = hmac.new(
-        secret_signing,
-        string_to_sign.encode("utf-8"),
-        hashlib.sha256
-    ).hexdigest()
-
-    # ===== Step 4: Authorization =====
-    authorization = (
-        f"{algorithm} "
-        f"Credential={secret_id}/{credential_scope}, "
-        f"SignedHeaders={signed_headers}, "
-        f"Signature={signature}"
-    )
+    # ===== 核心请求函数 =====
+    def request(
+        self,
+        *,
+        service: str,
+        action: str,
+        payload: dict,
+        region: str = "",
+        version: str = "2018-03-21",
+        host: str = None,
+        timeout: int = None,
+    ):
+        if not host:
+            host = f"{service}.tencentcloudapi.com"
+
+        endpoint = self.endpoint or host
+        algorithm = "TC3-HMAC-SHA256"
+        timestamp = int(time.time())
+        date = datetime.utcfromtimestamp(timestamp).strftime("%Y-%m-%d")
+
+        payload_json = json.dumps(payload, separators=(",", ":"), ensure_ascii=False)
+
+        # ===== Step 1: Canonical Request =====
+        http_request_method = "POST"
+        canonical_uri = "/"
+        canonical_querystring = ""
+        content_type = "application/json; charset=utf-8"
+
+        canonical_headers = (
+            f"content-type:{content_type}\n"
+            f"host:{host}\n"
+            f"x-tc-action:{action.lower()}\n"
+        )
+
+        signed_headers = "content-type;host;x-tc-action"
+        hashed_payload = hashlib.sha256(payload_json.encode("utf-8")).hexdigest()
+
+        canonical_request = (
+            http_request_method + "\n" +
+            canonical_uri + "\n" +
+            canonical_querystring + "\n" +
+            canonical_headers + "\n" +
+            signed_headers + "\n" +
+            hashed_payload
+        )
+
+        # ===== Step 2: String To Sign =====
+        credential_scope = f"{date}/{service}/tc3_request"
+        hashed_canonical_request = hashlib.sha256(
+            canonical_request.encode("utf-8")
+        ).hexdigest()
+
+        string_to_sign = (
+            f"{algorithm}\n"
+            f"{timestamp}\n"
+            f"{credential_scope}\n"
+            f"{hashed_canonical_request}"
+        )
+
+        # ===== Step 3: Signature =====
+        signature = hmac.new(
+            self._signing_key(date, service),
+            string_to_sign.encode("utf-8"),
+            hashlib.sha256
+        ).hexdigest()
 
-    # ===== Step 5: HTTP Request =====
-    headers = {
-        "Authorization": authorization,
-        "Content-Type": content_type,
-        "Host": host,
-        "X-TC-Action": action,
-        "X-TC-Timestamp": str(timestamp),
-        "X-TC-Version": version,
-    }
-    if region:
-        headers["X-TC-Region"] = region
-
-    conn = HTTPSConnection(endpoint, timeout=timeout)
-    conn.request("POST", "/", body=payload_json.encode("utf-8"), headers=headers)
-    resp = conn.getresponse()
-    data = resp.read().decode("utf-8")
-
-    if resp.status != 200:
-        raise RuntimeError(f"HTTP {resp.status}: {data}")
-
-    return json.loads(data)
+        # ===== Step 4: Authorization =====
+        authorization = (
+            f"{algorithm} "
+            f"Credential={self.secret_id}/{credential_scope}, "
+            f"SignedHeaders={signed_headers}, "
+            f"Signature={signature}"
+        )
+
+        # ===== Step 5: HTTP Request =====
+        headers = {
+            "Authorization": authorization,
+            "Content-Type": content_type,
+            "Host": host,
+            "X-TC-Action": action,
+            "X-TC-Timestamp": str(timestamp),
+            "X-TC-Version": version,
+        }
+        if region:
+            headers["X-TC-Region"] = region
+
+        status, data = self._send(endpoint, payload_json.encode("utf-8"), headers,
+                                  timeout if timeout is not None else self.timeout)
+
+        if status != 200:
+            raise RuntimeError(f"HTTP {status}: {data}")
+
+        return json.loads(data)
+
+
+# ---------- 默认客户端 ----------
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> TC3Client:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = TC3Client()
+    return _client
+
+
+def tc3_request(
+    *,
+    service: str,
+    action: str,
+    payload: dict,
+    region: str = "",
+    version: str = "2018-03-21",
+    host: str = None,
+    timeout: int = 10,
+):
+    """
+    通用腾讯云 TC3 API 请求封装，使用共享的默认客户端
+    """
+    return get_client().request(
+        service=service,
+        action=action,
+        payload=payload,
+        region=region,
+        version=version,
+        host=host,
+        timeout=timeout,
+    )
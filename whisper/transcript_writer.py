@@ -0,0 +1,108 @@
+import os
+import json
+import time
+import queue
+import logging
+import threading
+import config
+import metrics
+
+log = logging.getLogger(__name__)
+
+WRITE_SECONDS = metrics.histogram("voice_transcript_flush_seconds", "每次批量写入转录文件的耗时")
+DROPPED = metrics.counter("voice_transcript_dropped_total", "写入队列已满丢弃的转录记录数")
+
+class TranscriptWriter:
+    """ 后台线程批量写入转录记录，格式为每行一个JSON的追加文件
+    - 攒够flush_size条或距上次写入超过flush_interval秒时写入一次
+    - 文件超过max_bytes时轮转为 .1 .2 ...，最多保留backups个
+    - fsync策略：none（不调用）/ flush（每次写入后）/ rotate（只在轮转时）
+    path为None时不写入 """
+    def __init__(self, path=None, flush_interval=None, flush_size=None, max_bytes=None,
+                 backups=None, fsync=None):
+        self.path = path if path is not None else config.FileName
+        self.flush_interval = flush_interval or config.TranscriptFlushInterval
+        self.flush_size = flush_size or config.TranscriptFlushSize
+        self.max_bytes = config.TranscriptMaxBytes if max_bytes is None else max_bytes
+        self.backups = config.TranscriptBackups if backups is None else backups
+        self.fsync = fsync or config.TranscriptFsync
+        if self.fsync not in ("none", "flush", "rotate"):
+            raise ValueError(f"未知的fsync策略: {self.fsync}")
+        self.q = queue.Queue(config.TranscriptQueueSize)
+        self.f = None
+        self.thread = None
+        if self.path:
+            self.thread = threading.Thread(target=self._run, name="transcript-writer", daemon=True)
+            self.thread.start()
+
+    def write(self, record):
+        # 在识别流水线中调用，只入队不等待磁盘
+        if self.thread is None:
+            return
+        try:
+            self.q.put_nowait(record)
+        except queue.Full:
+            DROPPED.inc()
+            log.warning("转录写入队列已满，丢弃记录")
+
+    def close(self):
+        if self.thread is not None:
+            self.q.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                record = self.q.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                record = False
+            if record is None:
+                self._flush(batch)
+                self._close_file()
+                return
+            if record:
+                batch.append(record)
+            if len(batch) >= self.flush_size or time.monotonic() >= deadline:
+                self._flush(batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+
+    def _flush(self, batch):
+        if not batch:
+            return
+        data = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in batch).encode("utf-8")
+        try:
+            with WRITE_SECONDS.time():
+                self._rotate_if_needed(len(data))
+                if self.f is None:
+                    self.f = open(self.path, "ab")
+                self.f.write(data)
+                self.f.flush()
+                if self.fsync == "flush":
+                    os.fsync(self.f.fileno())
+        except OSError as e:
+            log.error("写入转录文件失败: %r", e)
+
+    def _rotate_if_needed(self, incoming):
+        if self.max_bytes <= 0 or not os.path.isfile(self.path):
+            return
+        if os.path.getsize(self.path) + incoming <= self.max_bytes:
+            return
+        if self.fsync == "rotate" and self.f is not None:
+            os.fsync(self.f.fileno())
+        self._close_file()
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def _close_file(self):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
@@ -0,0 +1,209 @@
+import time
+import queue
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import config
+import metrics
+import translator
+
+log = logging.getLogger(__name__)
+
+PROVIDER_SECONDS = metrics.histogram("voice_translate_provider_seconds", "各翻译接口每次请求的耗时")
+PROVIDER_FAILURES = metrics.counter("voice_translate_provider_failures_total", "各翻译接口失败或超时的次数")
+HEDGED = metrics.counter("voice_translate_hedged_total", "首选接口没有及时返回、同时请求下一个接口的次数")
+LOST = metrics.counter("voice_translate_lost_total", "所有翻译接口都失败、只发送原文的句子数")
+
+class CircuitBreaker:
+    """ 连续失败failures次后断开，cooldown秒内不再请求该接口
+    冷却结束后放行一次试探请求，成功则恢复，失败则继续断开 """
+    def __init__(self, failures=None, cooldown=None):
+        self.failures = failures or config.TranslateBreakerFailures
+        self.cooldown = cooldown or config.TranslateBreakerCooldown
+        self.count = 0          # 连续失败的次数
+        self.opened = None      # 断开的时间点
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened is None:
+                return True
+            if time.monotonic() - self.opened >= self.cooldown:
+                self.opened = time.monotonic()
+                return True
+            return False
+
+    def record(self, ok):
+        with self.lock:
+            if ok:
+                self.count = 0
+                self.opened = None
+                return
+            self.count += 1
+            if self.count >= self.failures:
+                if self.opened is None:
+                    log.warning("翻译接口连续失败%d次，%ss内不再请求", self.count, self.cooldown)
+                self.opened = time.monotonic()
+
+class Provider:
+    """ 翻译接口：translate_batch输入若干句原文，返回对应的译文，网络请求使用self.timeout作为超时
+    每个接口有独立的线程池、超时、熔断器和最近的耗时记录（用于计算对冲等待时间），
+    一个接口的请求卡住时不会占用其他接口的线程 """
+    name = None
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout or config.TranslateTimeouts.get(self.name, config.TranslateTimeout)
+        self.breaker = CircuitBreaker()
+        self.latencies = deque(maxlen=200)
+        self.executor = ThreadPoolExecutor(config.TranslateProviderThreads,
+                                           thread_name_prefix=f"translate-{self.name}")
+
+    def translate_batch(self, texts, src, tgt):
+        raise NotImplementedError
+
+    def hedge_delay(self):
+        # 最近耗时的p95，样本太少时使用上限
+        if len(self.latencies) < 10:
+            return config.TranslateHedgeMax
+        latencies = sorted(self.latencies)
+        p95 = latencies[int(len(latencies) * config.TranslateHedgeQuantile) - 1]
+        return min(max(p95, config.TranslateHedgeMin), config.TranslateHedgeMax)
+
+class TencentProvider(Provider):
+    name = "tencent"
+
+    def translate_batch(self, texts, src, tgt):
+        return translator.tencent_translate_batch(texts, src, tgt, timeout=self.timeout)
+
+class GoogleProvider(Provider):
+    name = "google"
+
+    def translate_batch(self, texts, src, tgt):
+        return [translator.google_web_translate(text, src, tgt, timeout=self.timeout) for text in texts]
+
+class StubProvider(Provider):
+    name = "stub"
+
+    def translate_batch(self, texts, src, tgt):
+        return [translator.stub_translate(text, src, tgt) for text in texts]
+
+class LocalProvider(Provider):
+    """ 本地离线翻译模型（transformers的MarianMT等），不依赖网络，第一次使用时加载 """
+    name = "local"
+
+    def __init__(self, timeout=None, model_name=None):
+        super().__init__(timeout)
+        self.model_name = model_name or config.LocalTranslateModel
+        self.pipe = None
+        self.lock = threading.Lock()
+
+    def load(self):
+        if self.pipe is None:
+            from transformers import pipeline
+            self.pipe = pipeline("translation", model=self.model_name, device="cpu")
+            log.info("本地翻译模型已加载: %s", self.model_name)
+        return self.pipe
+
+    def translate_batch(self, texts, src, tgt):
+        keys = [(translator.normalize(text), src, tgt, self.name) for text in texts]
+        results = [translator.cache.get(key) for key in keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            with self.lock:
+                outputs = self.load()([texts[i] for i in missing])
+            for i, output in zip(missing, outputs):
+                results[i] = output["translation_text"]
+                translator.cache.put(keys[i], results[i])
+        return results
+
+class Attempt:
+    """ 对一个接口的一次请求，结果（成功、失败或超时）只向熔断器记录一次 """
+    def __init__(self, provider):
+        self.provider = provider
+        self.start = time.monotonic()
+        self.deadline = self.start + provider.timeout
+        self.settled = False
+        self.lock = threading.Lock()
+
+    def settle(self, ok):
+        with self.lock:
+            if self.settled:
+                return
+            self.settled = True
+        self.provider.breaker.record(ok)
+        if not ok:
+            PROVIDER_FAILURES.inc(provider=self.provider.name)
+
+PROVIDERS = {
+    "tencent": TencentProvider,
+    "google": GoogleProvider,
+    "local": LocalProvider,
+    "stub": StubProvider,
+}
+
+class TranslationRouter:
+    """ 按顺序使用多个翻译接口：
+    - 首选接口在对冲等待时间（最近耗时的p95）内没有返回时，同时请求下一个接口，使用最先返回的结果
+    - 接口失败时立即请求下一个接口，超过各自的超时后不再等待
+    - 熔断的接口直接跳过
+    所有接口都失败时返回空译文，原文照常发送，不会因为翻译丢失字幕 """
+    def __init__(self, names=None):
+        names = config.TranslateProviders if names is None else names
+        self.providers = [PROVIDERS[name]() for name in names]
+
+    def translate_batch(self, texts, src=config.SourceLanguage, tgt=config.TargetLanguage):
+        if not texts or not self.providers:
+            return ["" for _ in texts]
+        results = queue.Queue()
+        candidates = iter(self.providers)
+        running = {}    # 接口 -> Attempt
+        hedge_at = self._launch(candidates, running, results, texts, src, tgt)
+        while running:
+            now = time.monotonic()
+            wait = min(attempt.deadline for attempt in running.values()) - now
+            if hedge_at is not None:
+                wait = min(wait, hedge_at - now)
+            try:
+                provider, translated, error = results.get(timeout=max(wait, 0))
+            except queue.Empty:
+                now = time.monotonic()
+                for provider, attempt in list(running.items()):
+                    if now >= attempt.deadline:
+                        # 不再等待，立即计入熔断器
+                        log.warning("%s翻译超时（%ss）", provider.name, provider.timeout)
+                        attempt.settle(False)
+                        del running[provider]
+                if hedge_at is not None and now >= hedge_at or not running:
+                    hedge_at = self._launch(candidates, running, results, texts, src, tgt)
+                    if hedge_at is not None:
+                        HEDGED.inc()
+                continue
+            if error is None:
+                return translated
+            log.warning("%s翻译失败: %r", provider.name, error)
+            running.pop(provider, None)
+            hedge_at = self._launch(candidates, running, results, texts, src, tgt)
+        log.error("所有翻译接口都失败，只发送原文")
+        LOST.inc(len(texts))
+        return ["" for _ in texts]
+
+    def _launch(self, candidates, running, results, texts, src, tgt):
+        # 请求下一个没有熔断的接口，返回下一次对冲的时间点，没有可用的接口时返回None
+        for provider in candidates:
+            if not provider.breaker.allow():
+                continue
+            attempt = running[provider] = Attempt(provider)
+            future = provider.executor.submit(provider.translate_batch, texts, src, tgt)
+            future.add_done_callback(lambda f, attempt=attempt: self._done(attempt, f, results))
+            return attempt.start + provider.hedge_delay()
+        return None
+
+    def _done(self, attempt, future, results):
+        provider = attempt.provider
+        seconds = time.monotonic() - attempt.start
+        provider.latencies.append(seconds)
+        PROVIDER_SECONDS.observe(seconds, provider=provider.name)
+        attempt.settle(future.exception() is None and seconds <= provider.timeout)
+        # 超时后返回的结果仍然可以使用
+        results.put((provider, None if future.exception() else future.result(), future.exception()))
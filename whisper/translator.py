@@ -1,8 +1,108 @@
+import time
+import logging
+import sqlite3
+import threading
+import functools
+from collections import OrderedDict
 import requests
 import config
+import metrics
+
+log = logging.getLogger(__name__)
+
+CACHE_LOOKUPS = metrics.counter("voice_translate_cache_total", "翻译缓存的命中与未命中次数")
+
+def normalize(text):
+    # 忽略大小写和多余的空白
+    return " ".join(text.split()).casefold()
+
+class TranslationCache:
+    """ 翻译结果缓存：内存中的LRU + 可选的SQLite持久化，重启后仍然有效
+    键为(规范化的原文, 源语言, 目的语言, 翻译接口) """
+    def __init__(self, max_size=config.TranslateCacheSize, ttl=config.TranslateCacheTTL,
+                 path=config.TranslateCacheFile):
+        self.max_size = max_size
+        self.ttl = ttl                  # 过期时间（秒），0表示不过期
+        self.items = OrderedDict()      # 键 -> (写入时间, 译文)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.db = None
+        if path:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "text TEXT, src TEXT, tgt TEXT, provider TEXT, value TEXT, created REAL, "
+                "PRIMARY KEY (text, src, tgt, provider))")
+            self.db.commit()
+
+    def _expired(self, created):
+        return self.ttl > 0 and time.time() - created > self.ttl
+
+    def get(self, key):
+        with self.lock:
+            item = self.items.get(key)
+            if item is not None and self._expired(item[0]):
+                del self.items[key]
+                item = None
+            if item is None and self.db is not None:
+                row = self.db.execute(
+                    "SELECT created, value FROM cache WHERE text=? AND src=? AND tgt=? AND provider=?",
+                    key).fetchone()
+                if row is not None and not self._expired(row[0]):
+                    item = row
+                    self._remember(key, item)
+            if item is None:
+                self.misses += 1
+                CACHE_LOOKUPS.inc(result="miss")
+                return None
+            self.items.move_to_end(key)
+            self.hits += 1
+            CACHE_LOOKUPS.inc(result="hit")
+            return item[1]
+
+    def put(self, key, value):
+        with self.lock:
+            item = (time.time(), value)
+            self._remember(key, item)
+            if self.db is not None:
+                self.db.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?, ?)", (*key, value, item[0]))
+                self.db.commit()
+
+    def _remember(self, key, item):
+        self.items[key] = item
+        self.items.move_to_end(key)
+        while len(self.items) > self.max_size:
+            self.items.popitem(last=False)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self.items),
+        }
+
+cache = TranslationCache()
+
+def cached(provider):
+    # 为翻译函数加上缓存，provider区分不同的翻译接口
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(text, src=config.SourceLanguage, tgt=config.TargetLanguage, timeout=10):
+            key = (normalize(text), src, tgt, provider)
+            translated = cache.get(key)
+            if translated is None:
+                translated = func(text, src, tgt, timeout)
+                cache.put(key, translated)
+            return translated
+        return wrapper
+    return decorator
 
 # 使用谷歌翻译网页接口进行翻译
-def google_web_translate(text, src=config.SourceLanguage, tgt=config.TargetLanguage):
+@cached("google")
+def google_web_translate(text, src=config.SourceLanguage, tgt=config.TargetLanguage, timeout=10):
     # 在linux中使用了代理，windows不需要
     proxies = config.PROXY
 
@@ -20,13 +120,20 @@ def google_web_translate(text, src=config.SourceLanguage, tgt=config.TargetLangu
     }
 
     # 添加代理
-    r = requests.get(url, params=params, headers=headers, timeout=10, proxies=proxies)
+    r = requests.get(url, params=params, headers=headers, timeout=timeout, proxies=proxies)
     r.raise_for_status()
 
     data = r.json()
     return "".join([item[0] for item in data[0]])
 
-def tencent_translate_api(text, src=config.SourceLanguage, tgt=config.TargetLanguage):
+def stub_translate(text, src=config.SourceLanguage, tgt=config.TargetLanguage):
+    # 本地的模拟翻译，不访问网络，用于回放测试
+    if config.StubTranslateDelay > 0:
+        time.sleep(config.StubTranslateDelay)
+    return f"[{tgt}] {text}"
+
+@cached("tencent")
+def tencent_translate_api(text, src=config.SourceLanguage, tgt=config.TargetLanguage, timeout=10):
     from tencent_sign import tc3_request
 
     resp = tc3_request(
@@ -38,9 +145,47 @@ def tencent_translate_api(text, src=config.SourceLanguage, tgt=config.TargetLang
             "Target": tgt,
             "ProjectId": 0
         },
-        region="ap-beijing"
+        region="ap-beijing",
+        timeout=timeout
     )
 
     return resp["Response"]["TargetText"]
 
-# print(tencent_translate_api("how are you!"))
\ No newline at end of file
+# print(tencent_translate_api("how are you!"))
+
+def tencent_translate_batch(texts, src=config.SourceLanguage, tgt=config.TargetLanguage, timeout=10):
+    # 多句话合并为一次TextTranslateBatch请求，已缓存的句子不再请求
+    from tencent_sign import tc3_request
+
+    keys = [(normalize(text), src, tgt, "tencent") for text in texts]
+    results = [cache.get(key) for key in keys]
+    missing = [i for i, result in enumerate(results) if result is None]
+    if len(missing) == 1:
+        results[missing[0]] = tencent_translate_api.__wrapped__(texts[missing[0]], src, tgt, timeout)
+        cache.put(keys[missing[0]], results[missing[0]])
+    elif missing:
+        try:
+            resp = tc3_request(
+                service="tmt",
+                action="TextTranslateBatch",
+                payload={
+                    "SourceTextList": [texts[i] for i in missing],
+                    "Source": src,
+                    "Target": tgt,
+                    "ProjectId": 0
+                },
+                region="ap-beijing",
+                timeout=timeout
+            )
+            targets = resp["Response"]["TargetTextList"]
+            if len(targets) != len(missing):
+                raise RuntimeError(f"批量翻译返回{len(targets)}条结果，请求了{len(missing)}条")
+        except Exception as e:
+            # 批量请求失败时逐句翻译
+            log.warning("批量翻译失败，改为逐句翻译: %r", e)
+            targets = [tencent_translate_api.__wrapped__(texts[i], src, tgt, timeout) for i in missing]
+        for i, target in zip(missing, targets):
+            results[i] = target
+            cache.put(keys[i], target)
+    return results
+
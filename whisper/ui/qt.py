@@ -1,6 +1,7 @@
 import sys
 import json
 from PyQt5.QtCore import Qt, QUrl
+from PyQt5.QtGui import QTextCursor
 from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, QTextEdit, QLineEdit, QPushButton
 from PyQt5.QtWebSockets import QWebSocket
 
@@ -19,6 +20,8 @@ class WebSocketClient(QWidget):
         self.history_log.setReadOnly(True)  # 设置为只读
         self.history_log.setStyleSheet("background-color: #f1f1f1; color: black;")
         self.layout.addWidget(self.history_log)
+        self.captions = {}      # (音频流, 句子编号) -> 在历史记录中的段落编号，译文返回后原地更新
+        self.latest = {}        # 音频流 -> 实时区域显示的句子编号
 
         # 实时消息区域
         self.realtime_log = QTextEdit(self)
@@ -70,10 +73,22 @@ class WebSocketClient(QWidget):
 
 
     def on_message_received(self, message):
-        """ 接收到消息 """
-        message = self.edit_message(message)
-        self.append_to_history(f"{message}\n")
-        self.realtime_log.setText(f"{message}")  # 实时显示
+        """ 接收到消息，中间结果只在实时区域显示，最终结果同时写入历史
+        先收到原文，译文返回后收到同一编号的完整结果，原地替换 """
+        data = self.parse_message(message)
+        if data is None:
+            return
+        if data.get("type") == "status":
+            self.append_to_history("[✓] 后端已就绪" if data["ready"] else "[…] 后端正在加载模型")
+            return
+        text = self.edit_message(data)
+        stream = data.get("stream", "default")
+        if data.get("final", True):
+            self.update_caption((stream, data["id"]), f"{text}\n")
+        # 较早句子的译文返回时不覆盖正在显示的新句子
+        if data["id"] >= self.latest.get(stream, 0):
+            self.latest[stream] = data["id"]
+            self.realtime_log.setText(f"{text}")  # 实时显示
 
     def on_error(self, error):
         self.append_to_history(f"[✗] WebSocket 错误: {error}")
@@ -101,19 +116,38 @@ class WebSocketClient(QWidget):
             self.append_to_history("[!] 请输入消息")
 
     def append_to_history(self, message):
-        """ 在历史日志中添加消息 """
-        self.history_log.append(message)
+        """ 在历史日志中添加消息，每条消息占一个段落（换行用段内换行符），返回段落编号 """
+        self.history_log.append(message.replace("\n", "\u2028"))
+        return self.history_log.document().lastBlock().blockNumber()
+
+    def update_caption(self, key, text):
+        """ 同一句话的第一条结果追加到历史，之后的结果只替换它所在的段落，不重绘整个历史，也不改变滚动位置 """
+        if key not in self.captions:
+            self.captions[key] = self.append_to_history(text)
+            return
+        block = self.history_log.document().findBlockByNumber(self.captions[key])
+        cursor = QTextCursor(block)
+        cursor.movePosition(QTextCursor.EndOfBlock, QTextCursor.KeepAnchor)
+        cursor.insertText(text.replace("\n", "\u2028"))
     
-    def edit_message(self, message):
-        """ 编辑接收到的消息，将字典中的内容格式化 """
-        # 如果 message 是字符串，尝试将其转换为字典
+    def parse_message(self, message):
+        """ 将接收到的 JSON 字符串解析为字典 """
         if isinstance(message, str):
             try:
-                message = json.loads(message)  # 解析 JSON 字符串为字典
+                return json.loads(message)  # 解析 JSON 字符串为字典
             except json.JSONDecodeError:
                 self.append_to_history("[✗] 无法解析消息")
-                return "错误：无法解析消息"
-        return f"{message['timestamp']}\n原文:{message['original']}\n翻译结果:{message['translated']}"
+                return None
+        return message
+
+    def edit_message(self, message):
+        """ 编辑接收到的消息，将字典中的内容格式化 """
+        # 多路音频时显示结果来自哪一路
+        stream = f"[{message['stream']}] " if message.get("stream", "default") != "default" else ""
+        if not message.get("final", True):
+            return f"{stream}{message['timestamp']}\n原文(识别中):{message['original']}"
+        translated = "(翻译中…)" if message.get("translating") else message['translated']
+        return f"{stream}{message['timestamp']}\n原文:{message['original']}\n翻译结果:{translated}"
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
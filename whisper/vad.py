@@ -0,0 +1,72 @@
+import os
+import logging
+import numpy as np
+import config
+
+log = logging.getLogger(__name__)
+
+def load_vad_model():
+    # 优先加载本地缓存的TorchScript模型，每次调用返回独立的模型（各自保存状态）
+    import torch
+    path = os.path.join(config.ModelCacheDir, "silero_vad.jit")
+    if config.CacheModels and os.path.exists(path):
+        return torch.jit.load(path)
+    torch.hub._validate_not_a_forked_repo = lambda a, b, c: True
+    vad_model, _ = torch.hub.load(
+                repo_or_dir="../silero-vad", model="silero_vad", source="local"
+            )
+    if config.CacheModels and isinstance(vad_model, torch.jit.ScriptModule):
+        os.makedirs(config.ModelCacheDir, exist_ok=True)
+        torch.jit.save(vad_model, path + ".tmp")
+        os.replace(path + ".tmp", path)
+        log.info("已生成模型缓存: %s", path)
+    return vad_model
+
+class StreamingVAD:
+    """ 流式语音活动检测：逐帧运行silero模型，帧之间保留模型的隐藏状态（VADIterator方式）
+    返回的语音起止位置都是以采样点为单位的绝对位置 """
+    def __init__(self, model, threshold=config.VadThreshold, hangover=config.Internal,
+                 speech_pad=config.SpeechPad, sampling_rate=config.RATE):
+        self.model = model
+        self.sampling_rate = sampling_rate
+        self.frame = 512 if sampling_rate == 16000 else 256  # silero每帧的采样点数
+        self.threshold = threshold
+        self.hangover = hangover        # 静音超过该长度才认为一句话结束
+        self.speech_pad = speech_pad
+        self.reset()
+
+    def reset(self):
+        self.model.reset_states()
+        self.pos = 0                    # 已处理到的绝对采样位置
+        self.triggered = False          # 是否处于说话状态
+        self.temp_end = 0               # 开始静音的位置
+
+    def warmup(self):
+        # 先处理几帧静音，完成模型的初始化
+        frame = np.zeros(self.frame, np.float32)
+        for _ in range(8):
+            self.process(frame)
+        self.reset()
+
+    def process(self, frame):
+        # 处理一帧音频，返回{'start': 位置}、{'end': 位置}或None
+        import torch
+        with torch.no_grad():
+            prob = self.model(torch.from_numpy(frame), self.sampling_rate).item()
+        self.pos += len(frame)
+
+        if prob >= self.threshold:
+            self.temp_end = 0
+            if not self.triggered:
+                self.triggered = True
+                return {'start': max(0, self.pos - len(frame) - self.speech_pad)}
+
+        elif prob < self.threshold - 0.15 and self.triggered:
+            if not self.temp_end:
+                self.temp_end = self.pos
+            if self.pos - self.temp_end >= self.hangover:
+                end = self.temp_end + self.speech_pad - len(frame)
+                self.temp_end = 0
+                self.triggered = False
+                return {'end': end}
+        return None
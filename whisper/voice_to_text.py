@@ -1,64 +1,99 @@
-import torch
 import config
-import whisper
 import requests
 import time
-import translator
+import uuid
+import urllib.parse
+from translate_router import TranslationRouter
+import audio_codec
+from batcher import DecodeBatcher
 
 class VoiceToText:
     def __init__(self, is_local):
+        self.is_local = is_local
+        self.router = TranslationRouter()
         if is_local:
-            self.device = "cuda" if torch.cuda.is_available() else "cpu"
-            self.model = whisper.load_model(config.VoiceToWordModel).to(self.device)
-            print(self.device)
+            import asr_backend
+            self.backend = asr_backend.create_backend()
+            if config.WarmUp:
+                self.backend.warmup()
+            # 多个识别线程同时提交的短句会被打包进同一个30s窗口
+            self.batcher = DecodeBatcher(self.backend.transcribe_batch, workers=self.backend.concurrency)
+        else:
+            # 复用与服务器的连接，服务器按X-Session对各客户端公平调度
+            self.session = requests.Session()
+            self.session.headers["X-Session"] = uuid.uuid4().hex
 
-    def recognize_audio_local(self, audio_data):
+    def transcribe(self, audio_data, sentence_id=0, language=None, prompt=None):
+        # 返回识别出的原文和耗时
+        if self.is_local:
+            return self.transcribe_local(audio_data, language, prompt)
+        return self.transcribe_server(audio_data, sentence_id, language, prompt)
+
+    def transcribe_local(self, audio_data, language=None, prompt=None):
         start = time.time()
-        result = whisper.decode(
-            self.model,
-            whisper.log_mel_spectrogram(whisper.pad_or_trim(audio_data)).to(self.device), 
-            whisper.DecodingOptions(
-            task="transcribe",
-            language=None,
-            fp16=torch.cuda.is_available()
-        ))
-        text, cost = result.text, round(time.time() - start, 3)
-        translated = translator.tencent_translate_api(text)
-        data = {
+        text = self.batcher.submit(audio_data, language=language, prompt=prompt).result()
+        return text, round(time.time() - start, 3)
+
+    def transcribe_partial(self, audio_data, prefix=None, language=None, prompt=None):
+        # 中间识别只在本地模式下可用
+        return self.backend.transcribe_partial(audio_data, prefix, language, prompt)
+
+    def detect_language(self, audio_data):
+        # 远程模式由服务器逐句检测
+        if self.is_local:
+            return self.backend.detect_language(audio_data)
+        return None, 0.0
+
+    def transcribe_server(self, audio_data, sentence_id=0, language=None, prompt=None):
+        # 以二进制PCM格式上传音频，语言和prompt放在请求头中
+        headers = {"Content-Type": audio_codec.CONTENT_TYPE}
+        if language:
+            headers["X-Language"] = language
+        if prompt:
+            headers["X-Prompt"] = urllib.parse.quote(prompt)
+        data = audio_codec.encode(audio_data, sentence_id, config.RATE,
+                                  config.ServerAudioDtype, config.ServerAudioCompress)
+        # 服务器过载时返回429，模型加载中或识别进程重启时返回带Retry-After的503，
+        # 两种情况都按Retry-After等待后重试，总时间不超过ServerTimeout
+        deadline = time.time() + config.ServerTimeout
+        while True:
+            resp = self.session.post(config.SERVER, data=data, headers=headers, timeout=config.ServerTimeout)
+            retryable = resp.status_code == 429 or (resp.status_code == 503 and "Retry-After" in resp.headers)
+            retry_after = float(resp.headers.get("Retry-After", 1))
+            if not retryable or time.time() + retry_after > deadline:
+                break
+            time.sleep(retry_after)
+        resp.raise_for_status()
+        return resp.json()["origin"], resp.json()["cost"]
+
+    def translate(self, text):
+        return self.translate_batch([text])[0]
+
+    def translate_batch(self, texts):
+        # 按config.TranslateProviders对冲请求多个翻译接口，全部失败时返回空译文
+        return self.router.translate_batch(texts)
+
+    def build_message(self, sentence_id, text, translated, timings=None, stream=config.DefaultStream,
+                      translating=False):
+        # translating为True表示译文还没有返回，之后会再发送同一编号的完整结果
+        return {
+            "id": sentence_id,
+            "stream": stream,
             "original": text,
             "translated": translated,
             "final": True,
-            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
+            "translating": translating,
+            "timestamp": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()),
+            "timings": timings or {}
         }
-        self.text_write_file(text)
-        self.text_write_file(translated)
-        print("原文:" + text)
-        print("翻译结果:" + translated)
-        print("翻译耗时:" + str(cost) + "s")
-        return data
-    
-    def recognize_audio_server(self, audio_data):
-        resp = requests.post(
-            config.SERVER,
-            json={"audio": audio_data.tolist()}
-        )        
-        text, cost = resp.json()["origin"], resp.json()["cost"]
-        translated = translator.tencent_translate_api(text)
-        data = {
-            "original": text,
-            "translated": translated,
-            "final": True,
+
+    def build_partial_message(self, sentence_id, committed, unstable, stream=config.DefaultStream):
+        return {
+            "id": sentence_id,
+            "stream": stream,
+            "original": " ".join(t for t in (committed, unstable) if t),
+            "committed": committed,
+            "translated": "",
+            "final": False,
             "timestamp": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
         }
-        self.text_write_file(text)
-        self.text_write_file(translated)
-        print("原文:" + text)
-        print("翻译结果:" + translated)
-        print("翻译耗时:" + str(cost) + "s")
-        return data
-    def text_write_file(self, text):
-        with open(config.FileName, "a", encoding="utf-8") as f:
-            f.write(text + "\n")
-        
-
-
@@ -0,0 +1,91 @@
+import time
+import asyncio
+import logging
+import config
+import metrics
+
+log = logging.getLogger(__name__)
+
+SEND_SECONDS = metrics.histogram("voice_ws_send_seconds", "WebSocket 每条消息的发送耗时")
+EVICTED = metrics.counter("voice_ws_evicted_total", "因接收过慢或发送失败被断开的连接数")
+
+class Subscriber:
+    def __init__(self, ws, queue_size):
+        self.ws = ws
+        self.queue = asyncio.Queue(queue_size)  # 待发送的消息
+        self.task = None                        # 发送协程
+
+class ConnectionHub:
+    """ 管理多个WebSocket连接，每个连接有独立的有界发送队列和发送协程
+    工作线程通过publish_threadsafe投递消息后立即返回，不等待网络发送
+    发送队列满或发送超时的慢连接会被断开，不影响其他连接 """
+    def __init__(self, queue_size=config.WsQueueSize, send_timeout=config.WsSendTimeout):
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        self.loop = None
+        self.clients = set()
+        metrics.gauge("voice_ws_clients", "当前的 WebSocket 连接数").set_function(lambda: len(self.clients))
+
+    def bind(self, loop):
+        self.loop = loop
+
+    async def serve(self, ws):
+        # 处理一个已经accept的连接，直到断开
+        sub = Subscriber(ws, self.queue_size)
+        sub.task = asyncio.create_task(self._sender(sub))
+        self.clients.add(sub)
+        log.info("客户端已连接，当前连接数: %d", len(self.clients))
+        try:
+            while True:
+                msg = await ws.receive_text()  # 接收消息
+                log.info("收到客户端消息: %s", msg)
+        except Exception:
+            log.info("客户端断开连接")
+        finally:
+            self._remove(sub)
+
+    async def _sender(self, sub):
+        while True:
+            message = await sub.queue.get()
+            start = time.perf_counter()
+            try:
+                await asyncio.wait_for(sub.ws.send_json(message), self.send_timeout)
+            except Exception as e:
+                log.warning("WebSocket 发送失败，断开连接: %r", e)
+                self._evict(sub)
+                return
+            SEND_SECONDS.observe(time.perf_counter() - start)
+
+    def publish(self, message):
+        # 在事件循环中调用，把消息放入每个连接的发送队列
+        for sub in list(self.clients):
+            try:
+                sub.queue.put_nowait(message)
+            except asyncio.QueueFull:
+                log.warning("客户端接收过慢，断开连接")
+                self._evict(sub)
+
+    def publish_threadsafe(self, message):
+        # 在工作线程中调用，交给事件循环后立即返回
+        if self.loop is None:
+            log.error("loop 为空，无法发送")
+            return
+        self.loop.call_soon_threadsafe(self.publish, message)
+
+    def _remove(self, sub):
+        self.clients.discard(sub)
+        if sub.task is not None and sub.task is not asyncio.current_task():
+            sub.task.cancel()
+
+    def _evict(self, sub):
+        if sub not in self.clients:
+            return
+        self._remove(sub)
+        EVICTED.inc()
+        asyncio.ensure_future(self._close(sub.ws))
+
+    async def _close(self, ws):
+        try:
+            await ws.close(code=1013)
+        except Exception:
+            pass